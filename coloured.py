@@ -17,10 +17,13 @@
 """Coloured widgets"""
 
 import fractions
+import functools
 
 from gi.repository import Gtk
 from gi.repository import Gdk
 from gi.repository import GObject
+from gi.repository import Pango
+from gi.repository import PangoCairo
 
 __all__ = []
 __author__ = "Peter Williams <pwil3058@gmail.com>"
@@ -28,12 +31,43 @@ __author__ = "Peter Williams <pwil3058@gmail.com>"
 GDK_BITS_PER_CHANNEL = 16
 GDK_ONE = (1 << GDK_BITS_PER_CHANNEL) - 1
 
-def best_foreground(colour, threshold=0.5):
-    wval = (colour.red * 0.299 + colour.green * 0.587 + colour.blue * 0.114)
-    if wval > GDK_ONE * threshold:
-        return Gdk.Color(0, 0, 0)
+def _best_foreground_rgb(rgb, threshold=0.5):
+    # NB: integer arithmetic with the weights scaled by 1000
+    wval = rgb[0] * 299 + rgb[1] * 587 + rgb[2] * 114
+    if wval > GDK_ONE * 1000 * threshold:
+        return (0, 0, 0)
     else:
-        return Gdk.Color(GDK_ONE, GDK_ONE, GDK_ONE)
+        return (GDK_ONE, GDK_ONE, GDK_ONE)
+
+def best_foreground(colour, threshold=0.5):
+    return Gdk.Color(*_best_foreground_rgb(_colour_rgb(colour), threshold))
+
+COLOUR_CACHE_SIZE = 4096
+
+def _colour_rgb(colour):
+    return (colour.red, colour.green, colour.blue)
+
+def _css_rgb(rgb):
+    return "rgb({},{},{})".format(*((c * 255 + GDK_ONE // 2) // GDK_ONE for c in rgb))
+
+def _new_css_provider(css):
+    provider = Gtk.CssProvider()
+    provider.load_from_data(css.encode())
+    return provider
+
+@functools.lru_cache(maxsize=COLOUR_CACHE_SIZE)
+def _label_colours(rgb):
+    return (Gdk.Color(*rgb), Gdk.Color(*_best_foreground_rgb(rgb)))
+
+@functools.lru_cache(maxsize=COLOUR_CACHE_SIZE)
+def _label_css_provider(rgb):
+    return _new_css_provider("* {{ background-color: {}; color: {}; }}\n".format(_css_rgb(rgb), _css_rgb(_best_foreground_rgb(rgb))))
+
+def _add_css_provider(widget, provider):
+    widget.get_style_context().add_provider(provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+
+def _remove_css_provider(widget, provider):
+    widget.get_style_context().remove_provider(provider)
 
 class ColourableLabel(Gtk.EventBox):
     def __init__(self, label=""):
@@ -52,19 +86,67 @@ class ColourableLabel(Gtk.EventBox):
         self.label.modify_fg(state, colour)
 
 class ColouredLabel(ColourableLabel):
-    def __init__(self, label, colour=None):
+    def __init__(self, label, colour=None, use_css=False):
         ColourableLabel.__init__(self, label=label)
+        self._use_css = use_css
+        self._css_provider = None
         if colour is not None:
             self.set_colour(colour)
     def set_colour(self, colour):
         assert isinstance(colour, Gdk.Color)
-        bg_colour = colour
-        fg_colour = best_foreground(colour)
+        if self._use_css:
+            self._set_css_provider(_label_css_provider(_colour_rgb(colour)))
+            return
+        bg_colour, fg_colour = _label_colours(_colour_rgb(colour))
         for state in [Gtk.StateType.NORMAL, Gtk.StateType.PRELIGHT, Gtk.StateType.ACTIVE]:
             self.modify_base(state, bg_colour)
             self.modify_bg(state, bg_colour)
             self.modify_fg(state, fg_colour)
             self.modify_text(state, fg_colour)
+    def _set_css_provider(self, provider):
+        # NB: the provider is shared by all labels with the same colour
+        for widget in (self, self.label):
+            if self._css_provider is not None:
+                _remove_css_provider(widget, self._css_provider)
+            _add_css_provider(widget, provider)
+        self._css_provider = provider
+
+# NB: presses happen while hovering so ACTIVE must out rank PRELIGHT
+_CSS_STATE_SELECTORS = {
+    Gtk.StateType.NORMAL: "*",
+    Gtk.StateType.ACTIVE: "*:active, *:hover:active",
+    Gtk.StateType.PRELIGHT: "*:hover",
+    Gtk.StateType.SELECTED: "*:selected",
+    Gtk.StateType.INSENSITIVE: "*:disabled",
+}
+
+@functools.lru_cache(maxsize=COLOUR_CACHE_SIZE)
+def _state_bg_fg_rgbs(rgb, state_ratios):
+    """Return the background and foreground RGBs for each state given
+    state_ratios as (state, numerator, denominator) tuples.
+    """
+    result = []
+    for state, numerator, denominator in state_ratios:
+        bg_rgb = tuple(min(c * numerator // denominator, GDK_ONE) for c in rgb)
+        result.append((state, bg_rgb, _best_foreground_rgb(bg_rgb)))
+    return tuple(result)
+
+def _hashable_state_ratios(state_value_ratio):
+    # a hashable form of a state_value_ratio for use as a cache key
+    return tuple((state, ratio.numerator, ratio.denominator) for state, ratio in state_value_ratio.items())
+
+@functools.lru_cache(maxsize=COLOUR_CACHE_SIZE)
+def _state_bg_fg_rgb_map(rgb, state_ratios):
+    return {state: (bg_rgb, fg_rgb) for state, bg_rgb, fg_rgb in _state_bg_fg_rgbs(rgb, state_ratios)}
+
+@functools.lru_cache(maxsize=COLOUR_CACHE_SIZE)
+def _state_bg_fg_colours(rgb, state_ratios):
+    return tuple((state, Gdk.Color(*bg_rgb), Gdk.Color(*fg_rgb)) for state, bg_rgb, fg_rgb in _state_bg_fg_rgbs(rgb, state_ratios))
+
+@functools.lru_cache(maxsize=COLOUR_CACHE_SIZE)
+def _button_css_provider(rgb, state_ratios):
+    rules = ("{} {{ background-color: {}; color: {}; }}\n".format(_CSS_STATE_SELECTORS[state], _css_rgb(bg_rgb), _css_rgb(fg_rgb)) for state, bg_rgb, fg_rgb in _state_bg_fg_rgbs(rgb, state_ratios))
+    return _new_css_provider("".join(rules))
 
 class ColouredButton(Gtk.EventBox):
     prelit_width = 2
@@ -76,9 +158,11 @@ class ColouredButton(Gtk.EventBox):
         Gtk.StateType.SELECTED: fractions.Fraction(1),
         Gtk.StateType.INSENSITIVE: fractions.Fraction(1, 4)
     }
-    def __init__(self, colour=None, label=None):
-        self.label = ColouredLabel(label, colour)
+    def __init__(self, colour=None, label=None, use_css=False):
+        self.label = ColouredLabel(label, colour, use_css=use_css)
         Gtk.EventBox.__init__(self)
+        self._use_css = use_css
+        self._css_provider = None
         self.set_size_request(25, 25)
         self.add_events(Gdk.EventMask.BUTTON_PRESS_MASK|Gdk.EventMask.BUTTON_RELEASE_MASK|Gdk.EventMask.LEAVE_NOTIFY_MASK|Gdk.EventMask.FOCUS_CHANGE_MASK)
         self.connect("button-press-event", self._button_press_cb)
@@ -112,16 +196,189 @@ class ColouredButton(Gtk.EventBox):
         self.frame.set_shadow_type(Gtk.ShadowType.ETCHED_IN)
         self.frame.set_border_width(self.unprelit_width)
         self.set_state(Gtk.StateType.NORMAL)
+    @classmethod
+    def _state_ratios(cls):
+        return _hashable_state_ratios(cls.state_value_ratio)
     def set_colour(self, colour):
         assert isinstance(colour, Gdk.Color)
         self.colour = colour
-        for state, value_ratio in self.state_value_ratio.items():
-            rgb = [min(int(getattr(colour, fld) * value_ratio), GDK_ONE) for fld in ["red", "green", "blue"]]
-            bg_gcolour = Gdk.Color(*rgb)
-            fg_gcolour = best_foreground(bg_gcolour)
-            self.modify_base(state, bg_gcolour)
-            self.modify_bg(state, bg_gcolour)
-            self.modify_fg(state, fg_gcolour)
-            self.modify_text(state, fg_gcolour)
+        rgb = _colour_rgb(colour)
+        if self._use_css:
+            provider = _button_css_provider(rgb, self._state_ratios())
+            if self._css_provider is not None:
+                _remove_css_provider(self, self._css_provider)
+            _add_css_provider(self, provider)
+            self._css_provider = provider
+        else:
+            for state, bg_gcolour, fg_gcolour in _state_bg_fg_colours(rgb, self._state_ratios()):
+                self.modify_base(state, bg_gcolour)
+                self.modify_bg(state, bg_gcolour)
+                self.modify_fg(state, fg_gcolour)
+                self.modify_text(state, fg_gcolour)
         self.label.set_colour(colour)
 GObject.signal_new("clicked", ColouredButton, GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_INT,))
+
+def new_coloured_buttons(colours, labels=None):
+    """Return a list of ColouredButtons for the given colours (e.g. for
+    a palette) that share a CSS provider per distinct colour rather
+    than each setting its colours for every state.
+    """
+    if labels is None:
+        return [ColouredButton(colour, use_css=True) for colour in colours]
+    return [ColouredButton(colour, label, use_css=True) for colour, label in zip(colours, labels)]
+
+class ColouredSwatchGrid(Gtk.Box):
+    """A scrollable grid of colour swatches drawn directly with cairo
+    (rather than a ColouredButton per colour) so that only the visible
+    swatches cost anything and very large palettes are practical.
+    Emits "clicked" with the swatch's index and the modifier state.
+    """
+    cell_width = 25
+    cell_height = 25
+    prelit_width = ColouredButton.prelit_width
+    state_value_ratio = ColouredButton.state_value_ratio
+    def __init__(self, colours=None, labels=None):
+        Gtk.Box.__init__(self, orientation=Gtk.Orientation.HORIZONTAL)
+        self._rgbs = []
+        self._labels = None
+        self._ncols = 1
+        self._prelit_index = None
+        self._active_index = None
+        self._drawing_area = Gtk.DrawingArea()
+        self._drawing_area.set_size_request(self.cell_width, self.cell_height)
+        self._drawing_area.add_events(Gdk.EventMask.BUTTON_PRESS_MASK|Gdk.EventMask.BUTTON_RELEASE_MASK|Gdk.EventMask.POINTER_MOTION_MASK|Gdk.EventMask.LEAVE_NOTIFY_MASK|Gdk.EventMask.SCROLL_MASK|Gdk.EventMask.SMOOTH_SCROLL_MASK)
+        self._drawing_area.connect("draw", self._draw_cb)
+        self._drawing_area.connect("size-allocate", self._size_allocate_cb)
+        self._drawing_area.connect("button-press-event", self._button_press_cb)
+        self._drawing_area.connect("button-release-event", self._button_release_cb)
+        self._drawing_area.connect("motion-notify-event", self._motion_notify_cb)
+        self._drawing_area.connect("leave-notify-event", self._leave_notify_cb)
+        self._drawing_area.connect("scroll-event", self._scroll_cb)
+        self._vadjustment = Gtk.Adjustment()
+        self._vadjustment.connect("value-changed", lambda _adj: self._drawing_area.queue_draw())
+        self.pack_start(self._drawing_area, expand=True, fill=True, padding=0)
+        self.pack_start(Gtk.Scrollbar(orientation=Gtk.Orientation.VERTICAL, adjustment=self._vadjustment), expand=False, fill=True, padding=0)
+        if colours is not None:
+            self.set_colours(colours, labels)
+        self.show_all()
+    def __len__(self):
+        return len(self._rgbs)
+    def set_colours(self, colours, labels=None):
+        """Display the given Gdk.Colors (with optional labels)
+        """
+        self._rgbs = [_colour_rgb(colour) for colour in colours]
+        self._labels = None if labels is None else list(labels)
+        self._prelit_index = self._active_index = None
+        self._update_adjustment()
+        self._drawing_area.queue_draw()
+    def get_colour(self, index):
+        return Gdk.Color(*self._rgbs[index])
+    def get_label(self, index):
+        return None if self._labels is None else self._labels[index]
+    def _update_adjustment(self):
+        height = self._drawing_area.get_allocated_height()
+        nrows = (len(self._rgbs) + self._ncols - 1) // self._ncols
+        upper = max(nrows * self.cell_height, height)
+        self._vadjustment.configure(min(self._vadjustment.get_value(), upper - height), 0, upper, self.cell_height, max(height - self.cell_height, self.cell_height), height)
+    def _size_allocate_cb(self, widget, allocation):
+        self._ncols = max(allocation.width // self.cell_width, 1)
+        self._update_adjustment()
+    def index_at(self, x, y):
+        """Return the index of the swatch at (x, y) in the drawing area
+        or None if there isn't one.
+        """
+        col = int(x) // self.cell_width
+        if col < 0 or col >= self._ncols:
+            return None
+        row = int(y + self._vadjustment.get_value()) // self.cell_height
+        index = row * self._ncols + col
+        return index if 0 <= index < len(self._rgbs) else None
+    def scroll_to_index(self, index):
+        row_top = (index // self._ncols) * self.cell_height
+        self._vadjustment.clamp_page(row_top, row_top + self.cell_height)
+    def _queue_draw_index(self, index):
+        if index is not None:
+            row, col = divmod(index, self._ncols)
+            y = row * self.cell_height - int(self._vadjustment.get_value())
+            self._drawing_area.queue_draw_area(col * self.cell_width, y, self.cell_width, self.cell_height)
+    def _set_prelit_index(self, index):
+        if index != self._prelit_index:
+            self._queue_draw_index(self._prelit_index)
+            self._prelit_index = index
+            self._queue_draw_index(index)
+    def _index_state(self, index):
+        if not self.is_sensitive():
+            return Gtk.StateType.INSENSITIVE
+        elif index == self._active_index and index == self._prelit_index:
+            return Gtk.StateType.ACTIVE
+        elif index == self._prelit_index:
+            return Gtk.StateType.PRELIGHT
+        return Gtk.StateType.NORMAL
+    def _draw_cb(self, widget, cairo_context):
+        offset = int(self._vadjustment.get_value())
+        x1, y1, x2, y2 = cairo_context.clip_extents()
+        first_row = max(int(y1 + offset) // self.cell_height, 0)
+        last_row = int(y2 + offset) // self.cell_height
+        state_ratios = _hashable_state_ratios(self.state_value_ratio)
+        layout = None if self._labels is None else PangoCairo.create_layout(cairo_context)
+        for row in range(first_row, last_row + 1):
+            y = row * self.cell_height - offset
+            start = row * self._ncols
+            for index in range(start, min(start + self._ncols, len(self._rgbs))):
+                x = (index - start) * self.cell_width
+                state = self._index_state(index)
+                bg_rgb, fg_rgb = _state_bg_fg_rgb_map(self._rgbs[index], state_ratios)[state]
+                cairo_context.set_source_rgb(*(c / GDK_ONE for c in bg_rgb))
+                cairo_context.rectangle(x, y, self.cell_width, self.cell_height)
+                cairo_context.fill()
+                if state in (Gtk.StateType.PRELIGHT, Gtk.StateType.ACTIVE):
+                    cairo_context.set_source_rgb(*(c / GDK_ONE for c in fg_rgb))
+                    cairo_context.set_line_width(self.prelit_width)
+                    half = self.prelit_width / 2
+                    cairo_context.rectangle(x + half, y + half, self.cell_width - self.prelit_width, self.cell_height - self.prelit_width)
+                    cairo_context.stroke()
+                if layout is not None and self._labels[index]:
+                    cairo_context.set_source_rgb(*(c / GDK_ONE for c in fg_rgb))
+                    layout.set_text(self._labels[index], -1)
+                    layout.set_width(self.cell_width * Pango.SCALE)
+                    layout.set_ellipsize(Pango.EllipsizeMode.END)
+                    layout.set_alignment(Pango.Alignment.CENTER)
+                    height = layout.get_pixel_size()[1]
+                    cairo_context.move_to(x, y + (self.cell_height - height) / 2)
+                    PangoCairo.show_layout(cairo_context, layout)
+        return True
+    def _button_press_cb(self, widget, event):
+        if event.button != 1:
+            return False
+        self._active_index = self.index_at(event.x, event.y)
+        self._queue_draw_index(self._active_index)
+        return True
+    def _button_release_cb(self, widget, event):
+        if event.button != 1:
+            return False
+        index = self.index_at(event.x, event.y)
+        active_index, self._active_index = self._active_index, None
+        self._queue_draw_index(active_index)
+        if index is not None and index == active_index:
+            self.emit("clicked", index, int(event.get_state()))
+        return True
+    def _motion_notify_cb(self, widget, event):
+        self._set_prelit_index(self.index_at(event.x, event.y))
+        return False
+    def _leave_notify_cb(self, widget, event):
+        self._set_prelit_index(None)
+        return False
+    def _scroll_cb(self, widget, event):
+        if event.direction == Gdk.ScrollDirection.SMOOTH:
+            delta = event.get_scroll_deltas()[2] * self._vadjustment.get_step_increment()
+        elif event.direction == Gdk.ScrollDirection.UP:
+            delta = -self._vadjustment.get_step_increment()
+        elif event.direction == Gdk.ScrollDirection.DOWN:
+            delta = self._vadjustment.get_step_increment()
+        else:
+            return False
+        lower, upper = self._vadjustment.get_lower(), self._vadjustment.get_upper() - self._vadjustment.get_page_size()
+        self._vadjustment.set_value(min(max(self._vadjustment.get_value() + delta, lower), upper))
+        self._set_prelit_index(self.index_at(event.x, event.y))
+        return True
+GObject.signal_new("clicked", ColouredSwatchGrid, GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_INT, GObject.TYPE_INT))
@@ -13,9 +13,19 @@
 ### along with this program; if not, write to the Free Software
 ### Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+import bisect
+import codecs
+import collections
+import contextlib
+import json
 import os
+import re
+import shlex
+import signal
+import threading
 import time
 
+from gi.repository import GLib
 from gi.repository import Gtk
 from gi.repository import Pango
 from gi.repository import GObject
@@ -24,21 +34,118 @@ from ..bab import runext
 from ..bab.decorators import singleton
 from ..bab import os_utils
 
+try:
+    from .. import CONFIG_DIR_PATH
+except ImportError:
+    from ... import CONFIG_DIR_PATH
+
 from . import dialogue
 from . import gutils
 from . import terminal
 from . import textview
 
+# An entry in the console's index of commands (mark is at its start)
+CmdIndexEntry = collections.namedtuple("CmdIndexEntry", ["timestamp", "cmd", "mark"])
+
+CmdRecord = collections.namedtuple("CmdRecord", ["start", "end", "duration", "cmd", "ecode", "stdout_bytes", "stderr_bytes"])
+
+class CmdHistory:
+    """An append only JSON Lines log of the commands run in the console
+    (one compact object per command) and queries over it.
+    """
+    _KEYS = ("s", "e", "d", "c", "x", "o", "r")
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._fobj = None
+    def record(self, start, end, cmd, ecode, stdout_bytes, stderr_bytes):
+        values = (round(start, 3), round(end, 3), round(end - start, 3), cmd, None if ecode is None else int(ecode), stdout_bytes, stderr_bytes)
+        try:
+            if self._fobj is None:
+                self._fobj = open(self.file_path, "a", encoding="utf-8")
+            self._fobj.write(json.dumps(dict(zip(self._KEYS, values)), separators=(",", ":")) + "\n")
+            self._fobj.flush()
+        except OSError:
+            # NB: the history is a nicety and not worth interrupting the user
+            self._fobj = None
+    def iter_records(self, since=None):
+        """Generate the CmdRecords (oldest first) optionally only those
+        for commands started at or after the time since.
+        """
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, "r", encoding="utf-8") as fobj:
+            for line in fobj:
+                try:
+                    data = json.loads(line)
+                    record = CmdRecord(*(data[key] for key in self._KEYS))
+                except (ValueError, KeyError, TypeError):
+                    continue # e.g. a line truncated by a crash
+                if since is None or record.start >= since:
+                    yield record
+    def slow_cmds(self, min_duration=1.0, since=None, limit=None):
+        """Return the CmdRecords for commands that took at least
+        min_duration seconds slowest first.
+        """
+        records = sorted((record for record in self.iter_records(since) if record.duration >= min_duration), key=lambda record: record.duration, reverse=True)
+        return records if limit is None else records[:limit]
+    def cmd_summary(self, since=None):
+        """Return a dict mapping each command name (the first word of
+        the command line) to a dict of its count, number of failures
+        and the total, mean and maximum durations.
+        """
+        summary = {}
+        for record in self.iter_records(since):
+            words = record.cmd.split(None, 1)
+            stats = summary.setdefault(words[0] if words else "", {"count": 0, "failures": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["failures"] += 1 if record.ecode else 0
+            stats["total"] += record.duration
+            stats["max"] = max(stats["max"], record.duration)
+        for stats in summary.values():
+            stats["mean"] = stats["total"] / stats["count"]
+        return summary
+
 @singleton
 class ConsoleLog(textview.Widget):
+    # Appended text is buffered (per tag run) and written to the text
+    # buffer at most this many times per second
+    MAX_FLUSHES_PER_SECOND = 10
+    # Scrollback is trimmed back to the limit when it exceeds it by this
+    # fraction so that trimming is done in chunks
+    TRIM_CHUNK_FRACTION = 0.1
+    SPILL_FILE_PATH = os.path.join(CONFIG_DIR_PATH, "console.log")
+    SPILL_FILE_MAX_BYTES = 1 << 22
+    SPILL_FILE_BACKUPS = 3
+    # Number of search matches passed back from the search thread at once
+    SEARCH_BATCH_SIZE = 256
+    HISTORY_FILE_PATH = os.path.join(CONFIG_DIR_PATH, "console_history.jsonl")
     def __init__(self, width_in_chars=81, fdesc=None):
         textview.Widget.__init__(self, width_in_chars=width_in_chars, fdesc=fdesc)
+        self._pending = []
+        self._cmd_index = []
+        self._trimmed_chars = 0
+        self._search_generation = 0
+        self.history = CmdHistory(self.HISTORY_FILE_PATH)
+        self._running_cmd = None
+        self._last_flush = 0.0
+        self._flush_timeout_id = None
+        self._synchronous_depth = 0
+        self._max_lines = None
+        self._max_chars = None
+        self._spill = False
         self.action_group = Gtk.ActionGroup("console_log")
         self.action_group.add_actions(
             [
                 ("console_log_clear", Gtk.STOCK_CLEAR, _("_Clear"), None,
                  _("Clear the console log"), self.clear),
+                ("console_log_view_trimmed", None, _("View _Trimmed Output"), None,
+                 _("View the output trimmed from the console log"), self._view_trimmed_acb),
+                ("console_log_prev_cmd", Gtk.STOCK_GO_UP, _("_Previous Command"), None,
+                 _("Scroll to the previous command in the console log"), self._prev_cmd_acb),
+                ("console_log_next_cmd", Gtk.STOCK_GO_DOWN, _("_Next Command"), None,
+                 _("Scroll to the next command in the console log"), self._next_cmd_acb),
             ])
+        self.action_group.get_action("console_log_view_trimmed").set_sensitive(False)
         self.view.connect("populate-popup", self._populate_popup_cb)
         self.view.set_editable(False)
         self.bold_tag = self.bfr.create_tag("BOLD", weight=Pango.Weight.BOLD, foreground="black", family="monospace")
@@ -46,48 +153,377 @@ class ConsoleLog(textview.Widget):
         self.stdout_tag = self.bfr.create_tag("STDOUT", foreground="black", family="monospace")
         self.stderr_tag = self.bfr.create_tag("STDERR", foreground="#AA0000", family="monospace")
         self.stdin_tag = self.bfr.create_tag("STDIN", foreground="#00AA00", family="monospace")
+        self.search_tag = self.bfr.create_tag("SEARCH", background="#FFFF00")
+        self.top_hbox.pack_start(Gtk.Label(_("Find: ")), expand=False, fill=True, padding=0)
+        self._search_entry = Gtk.Entry()
+        self._search_entry.set_tooltip_text(_("Regular expression to search for in the console log"))
+        self._search_entry.connect("activate", self._search_entry_cb)
+        self.top_hbox.pack_start(self._search_entry, expand=True, fill=True, padding=0)
         self._eobuf = self.bfr.create_mark("eobuf", self.bfr.get_end_iter(), False)
         self.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.ALWAYS)
         self.bfr.begin_user_action()
         self.bfr.set_text("")
         self._append_tagged_text("% ", self.bold_tag)
+        self._flush()
     def _populate_popup_cb(self, tview, menu):
+        menu.prepend(self.action_group.get_action("console_log_next_cmd").create_menu_item())
+        menu.prepend(self.action_group.get_action("console_log_prev_cmd").create_menu_item())
+        menu.prepend(self.action_group.get_action("console_log_view_trimmed").create_menu_item())
         menu.prepend(self.action_group.get_action("console_log_clear").create_menu_item())
+    def set_scrollback(self, max_lines=None, max_chars=None, spill=False):
+        """Limit the console's contents to max_lines lines and/or
+        max_chars characters (None meaning unlimited) by trimming the
+        oldest lines.  If spill is True trimmed text is appended to
+        a rotating log file (see spill_file_paths()).
+        """
+        self._max_lines = max_lines
+        self._max_chars = max_chars
+        self._spill = spill
+        self.action_group.get_action("console_log_view_trimmed").set_sensitive(spill)
+        self._trim()
+    def _trim_end_iter(self):
+        # the iter at the end of the (whole) lines to be trimmed or None
+        end_iter = None
+        nlines = self.bfr.get_line_count()
+        if self._max_lines is not None:
+            if nlines > self._max_lines * (1 + self.TRIM_CHUNK_FRACTION):
+                end_iter = self.bfr.get_iter_at_line(nlines - self._max_lines)
+        if self._max_chars is not None:
+            nchars = self.bfr.get_char_count()
+            if nchars > self._max_chars * (1 + self.TRIM_CHUNK_FRACTION):
+                char_iter = self.bfr.get_iter_at_offset(nchars - self._max_chars)
+                if not char_iter.starts_line():
+                    char_iter.forward_line()
+                # NB: never trim the last (current) line even if it's too long
+                last_line_iter = self.bfr.get_iter_at_line(nlines - 1)
+                if char_iter.compare(last_line_iter) > 0:
+                    char_iter = last_line_iter
+                if end_iter is None or char_iter.compare(end_iter) > 0:
+                    end_iter = char_iter
+        if end_iter is None or end_iter.is_start():
+            return None
+        return end_iter
+    def _trim(self):
+        end_iter = self._trim_end_iter()
+        if end_iter is None:
+            return
+        start_iter = self.bfr.get_start_iter()
+        if self._spill:
+            self._spill_text(self.bfr.get_text(start_iter, end_iter, True))
+        ntrimmed = end_iter.get_offset()
+        while self._cmd_index and self.bfr.get_iter_at_mark(self._cmd_index[0].mark).get_offset() < ntrimmed:
+            self.bfr.delete_mark(self._cmd_index.pop(0).mark)
+        self._trimmed_chars += ntrimmed
+        self.bfr.delete(start_iter, end_iter)
+    def spill_file_paths(self):
+        """Return the paths of the existing spill files oldest first.
+        """
+        paths = ["{}.{}".format(self.SPILL_FILE_PATH, index) for index in range(self.SPILL_FILE_BACKUPS, 0, -1)]
+        paths.append(self.SPILL_FILE_PATH)
+        return [path for path in paths if os.path.exists(path)]
+    def _spill_text(self, text):
+        path = self.SPILL_FILE_PATH
+        try:
+            if os.path.exists(path) and os.path.getsize(path) >= self.SPILL_FILE_MAX_BYTES:
+                for index in range(self.SPILL_FILE_BACKUPS - 1, 0, -1):
+                    if os.path.exists("{}.{}".format(path, index)):
+                        os.replace("{}.{}".format(path, index), "{}.{}".format(path, index + 1))
+                os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as fobj:
+                fobj.write(text)
+        except OSError:
+            # NB: losing old console output isn't worth interrupting the user
+            pass
+    def _view_trimmed_acb(self, _action=None):
+        widget = textview.Widget()
+        widget.view.set_editable(False)
+        texts = []
+        for path in self.spill_file_paths():
+            with open(path, "r", encoding="utf-8", errors="replace") as fobj:
+                texts.append(fobj.read())
+        widget.set_contents("".join(texts))
+        window = dialogue.Window(title=_("Trimmed Console Output"), parent=self)
+        window.set_default_size(640, 480)
+        window.add(widget)
+        window.show_all()
     def _append_tagged_text(self, text, tag):
-        model_iter = self.bfr.get_end_iter()
-        assert model_iter is not None, "ConsoleLogBuffer"
-        self.bfr.insert_with_tags(model_iter, text, tag)
+        if self._pending and self._pending[-1][1] is tag:
+            self._pending[-1][0].append(text)
+        else:
+            self._pending.append(([text], tag))
+    def _append_cmd_index_entry(self, timestamp, cmd):
+        # NB: a tag of None marks where the command will start in the buffer
+        self._pending.append(((timestamp, cmd), None))
+    def _flush(self):
+        if self._flush_timeout_id is not None:
+            GObject.source_remove(self._flush_timeout_id)
+            self._flush_timeout_id = None
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        for texts, tag in pending:
+            model_iter = self.bfr.get_end_iter()
+            assert model_iter is not None, "ConsoleLogBuffer"
+            if tag is None:
+                self._cmd_index.append(CmdIndexEntry(*texts, mark=self.bfr.create_mark(None, model_iter, True)))
+                continue
+            self.bfr.insert_with_tags(model_iter, "".join(texts), tag)
+        self._trim()
         self.view and self.view.scroll_to_mark(self._eobuf, 0.001, False, 0.0, 0.0)
+    def _flush_timeout_cb(self):
+        self._flush_timeout_id = None
+        self._flush()
+        return False
+    @contextlib.contextmanager
+    def synchronous_output(self):
+        """Let the display catch up after each flush while output is
+        written by code that blocks the main loop (e.g. a synchronous
+        command).
+        """
+        self._synchronous_depth += 1
+        try:
+            yield
+        finally:
+            self._synchronous_depth -= 1
+    def _update(self, force=False):
+        # Flush if it's been long enough since the last flush otherwise
+        # make sure a flush is scheduled
+        interval = 1.0 / self.MAX_FLUSHES_PER_SECOND
+        if force or time.monotonic() - self._last_flush >= interval:
+            self._flush()
+            # NB: output from the main loop (e.g. AsyncCmdRunner) mustn't
+            # start a (possibly blocking) nested main loop iteration
+            if self._synchronous_depth:
+                gutils.yield_to_pending_events()
+        elif self._flush_timeout_id is None:
+            self._flush_timeout_id = GObject.timeout_add(int(interval * 1000), self._flush_timeout_cb)
     def clear(self, _action=None):
+        self._pending = []
+        for entry in self._cmd_index:
+            self.bfr.delete_mark(entry.mark)
+        self._cmd_index = []
+        self._search_generation += 1
         self.bfr.end_user_action()
         self.bfr.set_text("")
         self._append_tagged_text("% ", self.bold_tag)
         self.bfr.begin_user_action()
-        gutils.yield_to_pending_events()
+        self._update(force=True)
     def start_cmd(self, cmd):
-        self._append_tagged_text("%s: " % time.strftime("%Y-%m-%d %H:%M:%S"), self.bold_tag)
+        timestamp = time.time()
+        self._running_cmd = {"start": timestamp, "cmd": cmd.strip(), "stdout_bytes": 0, "stderr_bytes": 0}
+        self._append_cmd_index_entry(timestamp, cmd)
+        self._append_tagged_text("%s: " % time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)), self.bold_tag)
         self._append_tagged_text(cmd, self.cmd_tag)
-        gutils.yield_to_pending_events()
+        self._update()
     def append_stdin(self, msg):
         self._append_tagged_text(msg, self.stdin_tag)
-        gutils.yield_to_pending_events()
+        self._update()
+    def _count_output(self, key, msg):
+        if self._running_cmd is not None and msg:
+            self._running_cmd[key] += len(msg.encode("utf-8", "replace"))
     def append_stdout(self, msg):
+        self._count_output("stdout_bytes", msg)
         self._append_tagged_text(msg, self.stdout_tag)
-        gutils.yield_to_pending_events()
+        self._update()
     def append_stderr(self, msg):
+        self._count_output("stderr_bytes", msg)
         self._append_tagged_text(msg, self.stderr_tag)
-        gutils.yield_to_pending_events()
-    def end_cmd(self, result=None):
+        self._update()
+    def end_cmd(self, result=None, ecode=None):
         if result:
-            self.append_stdout(result.stdout)
-            self.append_stderr(result.stderr)
+            self._count_output("stdout_bytes", result.stdout)
+            self._count_output("stderr_bytes", result.stderr)
+            self._append_tagged_text(result.stdout, self.stdout_tag)
+            self._append_tagged_text(result.stderr, self.stderr_tag)
+            ecode = getattr(result, "ecode", ecode)
+        if self._running_cmd is not None:
+            running, self._running_cmd = self._running_cmd, None
+            self.history.record(running["start"], time.time(), running["cmd"], ecode, running["stdout_bytes"], running["stderr_bytes"])
         self._append_tagged_text("% ", self.bold_tag)
-        gutils.yield_to_pending_events()
+        self._update(force=True)
     def append_entry(self, msg):
         self._append_tagged_text("%s: " % time.strftime("%Y-%m-%d %H:%M:%S"), self.bold_tag)
         self._append_tagged_text(msg, self.cmd_tag)
         self._append_tagged_text("% ", self.bold_tag)
-        gutils.yield_to_pending_events()
+        self._update(force=True)
+    def get_cmd_index(self):
+        """Return a list of (timestamp, cmd, offset) for the commands
+        currently in the console (oldest first).
+        """
+        self._flush()
+        return [(entry.timestamp, entry.cmd, self.bfr.get_iter_at_mark(entry.mark).get_offset()) for entry in self._cmd_index]
+    def jump_to_cmd(self, index):
+        """Scroll to the start of the index'th command in get_cmd_index().
+        """
+        mark = self._cmd_index[index].mark
+        self.bfr.place_cursor(self.bfr.get_iter_at_mark(mark))
+        self.view.scroll_to_mark(mark, 0.0, True, 0.0, 0.0)
+    def jump_to_cmd_at_time(self, timestamp):
+        """Scroll to the last command started at or before timestamp.
+        """
+        index = bisect.bisect_right([entry.timestamp for entry in self._cmd_index], timestamp) - 1
+        if index >= 0:
+            self.jump_to_cmd(index)
+    def _cmd_offsets(self):
+        return [self.bfr.get_iter_at_mark(entry.mark).get_offset() for entry in self._cmd_index]
+    def _visible_top_offset(self):
+        rect = self.view.get_visible_rect()
+        line_iter, _line_top = self.view.get_line_at_y(rect.y)
+        return line_iter.get_offset()
+    def _prev_cmd_acb(self, _action=None):
+        self._flush()
+        index = bisect.bisect_left(self._cmd_offsets(), self._visible_top_offset()) - 1
+        if index >= 0:
+            self.jump_to_cmd(index)
+    def _next_cmd_acb(self, _action=None):
+        self._flush()
+        index = bisect.bisect_right(self._cmd_offsets(), self._visible_top_offset())
+        if index < len(self._cmd_index):
+            self.jump_to_cmd(index)
+    def search(self, pattern, flags=0):
+        """Highlight the matches for the regular expression pattern
+        (finding them in a snapshot of the contents on a worker thread
+        and highlighting them as they're found) and scroll to the first.
+        """
+        regex = re.compile(pattern, flags)
+        self._flush()
+        self._search_generation += 1
+        self.bfr.remove_tag(self.search_tag, self.bfr.get_start_iter(), self.bfr.get_end_iter())
+        snapshot = self.bfr.get_text(self.bfr.get_start_iter(), self.bfr.get_end_iter(), True)
+        args = (self._search_generation, regex, snapshot, self._trimmed_chars)
+        threading.Thread(target=self._search_worker, args=args, daemon=True).start()
+    def _search_worker(self, generation, regex, snapshot, trimmed_chars):
+        batch = []
+        first = True
+        for match in regex.finditer(snapshot):
+            if generation != self._search_generation:
+                return
+            if match.end() > match.start():
+                batch.append(match.span())
+            if len(batch) >= self.SEARCH_BATCH_SIZE:
+                GLib.idle_add(self._highlight_matches, generation, trimmed_chars, batch, first)
+                batch, first = [], False
+        if batch:
+            GLib.idle_add(self._highlight_matches, generation, trimmed_chars, batch, first)
+    def _highlight_matches(self, generation, trimmed_chars, spans, first):
+        if generation != self._search_generation:
+            return False
+        # NB: offsets in the snapshot move back by whatever's been trimmed since
+        shift = self._trimmed_chars - trimmed_chars
+        scrolled = not first
+        for start, end in spans:
+            start, end = max(start - shift, 0), end - shift
+            if end <= 0:
+                continue
+            start_iter = self.bfr.get_iter_at_offset(start)
+            self.bfr.apply_tag(self.search_tag, start_iter, self.bfr.get_iter_at_offset(end))
+            if not scrolled:
+                self.view.scroll_to_iter(start_iter, 0.0, True, 0.0, 0.5)
+                scrolled = True
+        return False
+    def _search_entry_cb(self, entry):
+        pattern = entry.get_text()
+        if not pattern:
+            self._search_generation += 1
+            self.bfr.remove_tag(self.search_tag, self.bfr.get_start_iter(), self.bfr.get_end_iter())
+            return
+        try:
+            self.search(pattern)
+        except re.error as edata:
+            dialogue.main_window.alert_user(msg=_("Invalid regular expression: {0}").format(edata))
+
+
+class AsyncCmdRunner:
+    """Run commands (one at a time in the order they're submitted)
+    without blocking the main loop and stream their output into a
+    console as it arrives.  When a command finishes completion_callback
+    (if any) is called with the command, its exit code, (the tail of)
+    its stderr output and whether it was cancelled.  Commands that can't be started are reported
+    with SPAWN_FAILED_ECODE (as a shell would for one it can't find).
+    """
+    SPAWN_FAILED_ECODE = 127
+    READ_SIZE = 1 << 16
+    STDERR_TAIL_CHARS = 4096
+    def __init__(self, console, completion_callback=None):
+        self._console = console
+        self._completion_callback = completion_callback
+        self._queue = collections.deque()
+        self._current = None
+    @property
+    def is_running(self):
+        return self._current is not None
+    @property
+    def queued_cmds(self):
+        return list(self._queue)
+    def run(self, cmd):
+        """Run cmd (a command line string) once any running or
+        previously queued commands have finished.
+        """
+        self._queue.append(cmd)
+        if self._current is None:
+            self._start_next()
+    def cancel(self):
+        """Terminate the running command (if any).
+        """
+        if self._current is not None and self._current["ecode"] is None:
+            self._current["cancelled"] = True
+            try:
+                os.kill(self._current["pid"], signal.SIGTERM)
+            except OSError:
+                pass
+    def cancel_all(self):
+        """Discard the queued commands and terminate the running one.
+        """
+        self._queue.clear()
+        self.cancel()
+    def _start_next(self):
+        while self._queue:
+            cmd = self._queue.popleft()
+            self._console.start_cmd(cmd + "\n")
+            try:
+                pid, stdin_fd, stdout_fd, stderr_fd = GLib.spawn_async(shlex.split(cmd), flags=GLib.SpawnFlags.SEARCH_PATH|GLib.SpawnFlags.DO_NOT_REAP_CHILD, standard_input=True, standard_output=True, standard_error=True)
+            except (GLib.Error, ValueError) as edata:
+                self._console.append_stderr(str(edata) + "\n")
+                self._console.end_cmd(ecode=self.SPAWN_FAILED_ECODE)
+                self._completion_callback and self._completion_callback(cmd, self.SPAWN_FAILED_ECODE, str(edata), False)
+                continue
+            # NB: so commands that read stdin get EOF rather than the GUI's stdin
+            os.close(stdin_fd)
+            self._current = {"cmd": cmd, "pid": pid, "ecode": None, "open_fds": 2, "stderr_tail": "", "cancelled": False}
+            self._watch_output(stdout_fd, self._console.append_stdout, False)
+            self._watch_output(stderr_fd, self._console.append_stderr, True)
+            GLib.child_watch_add(GLib.PRIORITY_DEFAULT, pid, self._child_exit_cb)
+            return
+    def _watch_output(self, fdesc, append, is_stderr):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        channel = GLib.IOChannel.unix_new(fdesc)
+        GLib.io_add_watch(channel, GLib.PRIORITY_DEFAULT, GLib.IOCondition.IN|GLib.IOCondition.HUP|GLib.IOCondition.ERR, self._output_cb, fdesc, decoder, append, is_stderr)
+    def _output_cb(self, channel, condition, fdesc, decoder, append, is_stderr):
+        data = os.read(fdesc, self.READ_SIZE) if condition & GLib.IOCondition.IN else b""
+        text = decoder.decode(data, final=not data)
+        if text:
+            append(text)
+            if is_stderr:
+                self._current["stderr_tail"] = (self._current["stderr_tail"] + text)[-self.STDERR_TAIL_CHARS:]
+        if data:
+            return True
+        os.close(fdesc)
+        self._current["open_fds"] -= 1
+        self._finish_if_done()
+        return False
+    def _child_exit_cb(self, pid, status):
+        GLib.spawn_close_pid(pid)
+        self._current["ecode"] = os.waitstatus_to_exitcode(status)
+        self._finish_if_done()
+    def _finish_if_done(self):
+        current = self._current
+        if current["open_fds"] or current["ecode"] is None:
+            return
+        self._current = None
+        self._console.end_cmd(ecode=current["ecode"])
+        self._completion_callback and self._completion_callback(current["cmd"], current["ecode"], current["stderr_tail"], current["cancelled"])
+        self._start_next()
 
 @singleton
 class ConsoleLogWidget(Gtk.VBox, dialogue.BusyIndicatorUser):
@@ -100,6 +536,12 @@ class ConsoleLogWidget(Gtk.VBox, dialogue.BusyIndicatorUser):
             cmd_entry = gutils.EntryWithHistory()
             cmd_entry.connect("activate", self._cmd_entry_cb)
             hbox.pack_start(cmd_entry, expand=True, fill=True, padding=0)
+            self._cancel_button = Gtk.Button.new_with_label(_("Cancel"))
+            self._cancel_button.set_tooltip_text(_("Cancel the running command and any queued commands"))
+            self._cancel_button.set_sensitive(False)
+            self._cancel_button.connect("clicked", lambda _button: self._cmd_runner.cancel_all())
+            hbox.pack_start(self._cancel_button, expand=False, fill=True, padding=0)
+            self._cmd_runner = AsyncCmdRunner(self._text_widget, self._cmd_done_cb)
             self.pack_start(hbox, expand=False, fill=True, padding=0)
         self.pack_start(self._text_widget, expand=True, fill=True, padding=0)
         self.show_all()
@@ -124,16 +566,24 @@ class ConsoleLogWidget(Gtk.VBox, dialogue.BusyIndicatorUser):
     def append_entry(self, msg):
         return self._text_widget.append_entry(msg)
     def _cmd_entry_cb(self, entry):
-        from . import auto_update
         text = entry.get_text_and_clear_to_history()
         if not text:
             return
-        with self.showing_busy():
-            result = runext.run_cmd_in_console(self, text)
-        dialogue.main_window.report_any_problems(result)
+        self._cmd_runner.run(text)
+        # NB: run() finishes synchronously if the command can't be started
+        self._update_cancel_sensitivity()
+    def _update_cancel_sensitivity(self):
+        self._cancel_button.set_sensitive(bool(self._cmd_runner.is_running or self._cmd_runner.queued_cmds))
+    def _cmd_done_cb(self, cmd, ecode, stderr_tail, cancelled):
+        from . import auto_update
+        self._update_cancel_sensitivity()
+        # NB: the user doesn't need telling that a command they cancelled failed
+        if not cancelled:
+            dialogue.main_window.report_any_problems(runext.CmdResult(ecode, "", stderr_tail))
         auto_update.trigger_auto_update()
     def run_ext_cmd(self, *args, **kwargs):
-        return runext.run_cmd_in_console(self, *args, **kwargs)
+        with self._text_widget.synchronous_output():
+            return runext.run_cmd_in_console(self, *args, **kwargs)
 
 LOG = ConsoleLogWidget()
 
@@ -18,10 +18,15 @@
 
 # TODO: find out more about PyGTK printing and make this better
 
+import array
+import concurrent.futures
 import os
 import math
-import fractions
+import tempfile
 
+import cairo
+
+from gi.repository import GLib
 from gi.repository import Gdk
 from gi.repository import GdkPixbuf
 from gi.repository import Gtk
@@ -33,6 +38,8 @@ try:
 except ImportError:
     from ... import CONFIG_DIR_PATH
 
+from . import dialogue
+
 MM_PER_PT = 25.4 / 72
 
 _USER_SETTINGS_FILE = os.path.join(CONFIG_DIR_PATH, "printer.cfg")
@@ -45,19 +52,7 @@ if os.path.exists(_USER_SETTINGS_FILE) and os.path.getsize(_USER_SETTINGS_FILE):
 else:
     SETTINGS.to_file(_USER_SETTINGS_FILE)
 
-def print_text(text, parent=None):
-    """Print a plain text
-    """
-    prop = Gtk.PrintOperation()
-
-    prop.set_print_settings(SETTINGS)
-    prop.set_unit(Gtk.Unit.MM)
-
-    data = {"text" : text}
-
-    prop.connect( "begin-print", begin_print_text, data)
-    prop.connect("draw-page", draw_page_text, data)
-
+def _run_print_operation(prop, parent):
     res = prop.run(Gtk.PrintOperationAction.PRINT_DIALOG, parent)
 
     if res == Gtk.PrintOperationResult.ERROR:
@@ -74,39 +69,291 @@ def print_text(text, parent=None):
         if settings.to_file(_USER_SETTINGS_FILE):
             SETTINGS.load_file(_USER_SETTINGS_FILE)
 
+class StringLines:
+    """An index of the line start offsets in a string.
+    """
+    def __init__(self, text):
+        self._text = text
+        self._offsets = array.array("q", [0])
+        index = text.find("\n")
+        while index != -1:
+            self._offsets.append(index + 1)
+            index = text.find("\n", index + 1)
+        if self._offsets[-1] != len(text):
+            self._offsets.append(len(text))
+    def __len__(self):
+        return len(self._offsets) - 1
+    def get_lines(self, start, end):
+        """Return the text of lines start to end (exclusive).
+        """
+        return self._text[self._offsets[start]:self._offsets[end]]
+    def close(self):
+        pass
+
+class FileLines:
+    """An index of the line start offsets in a (seekable) binary file
+    containing UTF-8 text so that ranges of lines can be read without
+    holding the whole file in memory.
+    """
+    def __init__(self, fobj, close=False):
+        self._fobj = fobj
+        self._close = close
+        self._offsets = array.array("q", [fobj.tell()])
+        for line in fobj:
+            self._offsets.append(self._offsets[-1] + len(line))
+    @classmethod
+    def from_lines(cls, lines):
+        """Spool the (str) lines (which should include their line
+        endings e.g. those from an open text file) to a temporary file
+        and return an index of it.
+        """
+        fobj = tempfile.TemporaryFile()
+        for line in lines:
+            fobj.write(line.encode("utf-8"))
+        fobj.seek(0)
+        return cls(fobj, close=True)
+    def __len__(self):
+        return len(self._offsets) - 1
+    def get_lines(self, start, end):
+        """Return the text of lines start to end (exclusive).
+        """
+        self._fobj.seek(self._offsets[start])
+        return self._fobj.read(self._offsets[end] - self._offsets[start]).decode("utf-8", "replace")
+    def close(self):
+        if self._close:
+            self._fobj.close()
+
+def text_lines(text):
+    """Return a line index for text which may be a str or an iterable
+    of lines (e.g. an open text file or a generator).
+    """
+    if isinstance(text, str):
+        return StringLines(text)
+    return FileLines.from_lines(text)
+
+class TextPaginator:
+    """Allocate the text in a line index (see text_lines()) to pages one
+    page at a time laying out only the text that could be on that page.
+    Page boundaries are (line, column) positions so that lines that wrap
+    over more than a page are split where Pango wraps them.
+    """
+    # Limit the text laid out for one page when lines are very long
+    MAX_CHARS_PER_LINE = 1024
+    def __init__(self, lines, width, height, layout):
+        self.lines = lines
+        self.layout = layout
+        self.layout.set_width(int(width * Pango.SCALE))
+        self.layout.set_text("X", -1)
+        # NB: not get_pixel_size() as it rounds to whole (e.g. mm) units
+        lheight = self.layout.get_size()[1] / Pango.SCALE
+        self.lines_per_page = max(int(height / lheight), 1)
+        self.pages = []
+        self._posn = (0, 0)
+    @property
+    def is_complete(self):
+        return self._posn[0] >= len(self.lines) and len(self.pages) > 0
+    @staticmethod
+    def _block_position(start, block, nchars):
+        # the (line, column) position nchars into block (which starts at start)
+        line, col = start
+        posn = 0
+        while True:
+            index = block.find("\n", posn, nchars)
+            if index == -1:
+                return (line, col + nchars - posn)
+            line, col, posn = line + 1, 0, index + 1
+    def paginate_page(self):
+        """Allocate the next page's text and return True if all of the
+        text has now been allocated.
+        """
+        if self.is_complete:
+            return True
+        start = self._posn
+        last = min(start[0] + self.lines_per_page, len(self.lines))
+        block = self.lines.get_lines(start[0], last)[start[1]:]
+        end = (last, 0)
+        max_chars = self.lines_per_page * self.MAX_CHARS_PER_LINE
+        if len(block) > max_chars:
+            block = block[:max_chars]
+            end = self._block_position(start, block, max_chars)
+        self.layout.set_text(block, -1)
+        if self.layout.get_line_count() > self.lines_per_page:
+            nbytes = self.layout.get_line_readonly(self.lines_per_page).start_index
+            end = self._block_position(start, block, len(block.encode("utf-8")[:nbytes].decode("utf-8")))
+        self.pages.append((start, end))
+        self._posn = end
+        return self.is_complete
+    def paginate(self):
+        while not self.paginate_page():
+            pass
+        return len(self.pages)
+    def get_page_text(self, page_num):
+        (start_line, start_col), (end_line, end_col) = self.pages[page_num]
+        text = self.lines.get_lines(start_line, end_line)
+        if end_col:
+            text += self.lines.get_lines(end_line, end_line + 1)[:end_col]
+        return text[start_col:]
+    def layout_page(self, page_num):
+        """Return the layout set up to draw the given page.
+        """
+        self.layout.set_text(self.get_page_text(page_num), -1)
+        return self.layout
+    def draw_page(self, cairo_context, page_num):
+        cairo_context.move_to(0, 0)
+        PangoCairo.show_layout(cairo_context, self.layout_page(page_num))
+
+def print_text(text, parent=None):
+    """Print a plain text which may be a str or an iterable of lines
+    (e.g. an open text file or a generator).
+    """
+    lines = text_lines(text)
+    try:
+        print_text_lines(lines, parent)
+    finally:
+        lines.close()
+
+def print_text_file(file_path, parent=None):
+    """Print the (UTF-8) text in the named file without reading it all
+    into memory.
+    """
+    with open(file_path, "rb") as fobj:
+        print_text_lines(FileLines(fobj), parent)
+
+def print_text_lines(lines, parent=None):
+    """Print the text in the line index lines.
+    """
+    prop = Gtk.PrintOperation()
+
+    prop.set_print_settings(SETTINGS)
+    prop.set_unit(Gtk.Unit.MM)
+
+    data = {"lines" : lines}
+
+    prop.connect( "begin-print", begin_print_text, data)
+    prop.connect("paginate", paginate_text, data)
+    prop.connect("draw-page", draw_page_text, data)
+
+    _run_print_operation(prop, parent)
+
 def begin_print_text(operation, context, data):
     """
     Process the "begin-print" signal
     """
-    layout = context.create_pango_layout()
-    layout.set_width(int(context.get_width() * Pango.SCALE))
-    layout.set_text(data["text"])
-    _twidth, theight = layout.get_pixel_size()
-    data["layout"] = layout
-    lheight = float(theight) / layout.get_line_count()
-    pheight = context.get_height()
-    lpp = int(pheight / lheight)
-    data["lines_per_page"] = lpp
-    operation.set_n_pages(int(math.ceil(float(layout.get_line_count()) / lpp)))
+    data["paginator"] = TextPaginator(data["lines"], context.get_width(), context.get_height(), context.create_pango_layout())
+
+def paginate_text(operation, context, data):
+    """
+    Process the "paginate" signal (one page per call)
+    """
+    paginator = data["paginator"]
+    if paginator.paginate_page():
+        operation.set_n_pages(len(paginator.pages))
+        return True
+    return False
 
 def draw_page_text(operation, context, page_num, data):
     """
     Process the "draw-page" signal
     """
-    cc = context.get_cairo_context()
-
-    layout = data["layout"]
+    data["paginator"].draw_page(context.get_cairo_context(), page_num)
 
-    start_line = page_num * data["lines_per_page"]
-    if page_num + 1 != operation.props.n_pages:
-        end_line = start_line + data["lines_per_page"]
-    else:
-        end_line = None
-
-    layout.set_text("".join(data["text"].splitlines(True)[start_line:end_line]))
-
-    cc.move_to(0, 0)
-    cc.show_layout(layout)
+class MarkupChunkPaginator:
+    """Allocate marked up chunks to pages (with no page breaks within
+    a chunk unless the chunk itself is too big for one page) measuring
+    them with a single reused layout.  Pages are recorded as lists of
+    (chunk index, top, height) bands so that layouts only need to be
+    built when a page is drawn and chunks that are too big for one
+    page can be split across pages at line boundaries.
+    """
+    # Number of chunks measured per paginate_step() call
+    CHUNKS_PER_STEP = 64
+    def __init__(self, chunks, width, height, layout):
+        self.chunks = []
+        self._chunk_iter = iter(chunks)
+        self.page_height = height
+        self.layout = layout
+        self.layout.set_width(int(width * Pango.SCALE))
+        self.pages = []
+        self._page = []
+        self._page_height = 0
+        self.is_complete = False
+    def _layout_height(self):
+        # NB: not get_pixel_size() as it rounds to whole (e.g. mm) units
+        return self.layout.get_size()[1] / Pango.SCALE
+    def _line_yranges(self):
+        layout_iter = self.layout.get_iter()
+        while True:
+            y0, y1 = layout_iter.get_line_yrange()
+            yield (y0 / Pango.SCALE, y1 / Pango.SCALE)
+            if not layout_iter.next_line():
+                break
+    def _new_page(self):
+        self.pages.append(self._page)
+        self._page = []
+        self._page_height = 0
+    def _allocate_split_chunk(self, index):
+        # fill the remainder of the current page and then as many new
+        # pages as are needed breaking between lines
+        band_top = band_bottom = None
+        for y0, y1 in self._line_yranges():
+            if band_top is None:
+                if self._page and self._page_height + y1 - y0 > self.page_height:
+                    self._new_page()
+                band_top = y0
+            elif self._page_height + y1 - band_top > self.page_height:
+                self._page.append((index, band_top, band_bottom - band_top))
+                self._new_page()
+                band_top = y0
+            band_bottom = y1
+        self._page.append((index, band_top, band_bottom - band_top))
+        self._page_height += band_bottom - band_top
+    def paginate_step(self):
+        """Measure and allocate the next few chunks and return True if
+        all chunks have now been allocated.
+        """
+        if self.is_complete:
+            return True
+        for _count in range(self.CHUNKS_PER_STEP):
+            try:
+                chunk = next(self._chunk_iter)
+            except StopIteration:
+                if self._page or not self.pages:
+                    self._new_page()
+                self.is_complete = True
+                break
+            index = len(self.chunks)
+            self.chunks.append(chunk)
+            self.layout.set_markup(chunk, -1)
+            theight = self._layout_height()
+            if self._page_height + theight < self.page_height:
+                self._page.append((index, 0, theight))
+                self._page_height += theight
+            elif theight < self.page_height:
+                self._new_page()
+                self._page.append((index, 0, theight))
+                self._page_height = theight
+            else:
+                self._allocate_split_chunk(index)
+        return self.is_complete
+    def paginate(self):
+        while not self.paginate_step():
+            pass
+        return len(self.pages)
+    def draw_page(self, cairo_context, page_num):
+        """Draw the given page's chunks (laying them out on demand).
+        """
+        width = self.layout.get_width() / Pango.SCALE
+        y = 0
+        for index, top, height in self.pages[page_num]:
+            self.layout.set_markup(self.chunks[index], -1)
+            cairo_context.save()
+            # NB: clip so that only this band of a split chunk is drawn
+            cairo_context.rectangle(0, y, width, height)
+            cairo_context.clip()
+            cairo_context.move_to(0, y - top)
+            PangoCairo.show_layout(cairo_context, self.layout)
+            cairo_context.restore()
+            y += height
 
 def print_markup_chunks(chunks, parent=None):
     """
@@ -121,124 +368,249 @@ def print_markup_chunks(chunks, parent=None):
     data = {"chunks" : chunks}
     #
     prop.connect( "begin-print", begin_print_markup_chunks, data)
+    prop.connect("paginate", paginate_markup_chunks, data)
     prop.connect("draw-page", draw_page_markup_chunks, data)
     #
-    res = prop.run(Gtk.PrintOperationAction.PRINT_DIALOG, parent)
-    #
-    if res == Gtk.PrintOperationResult.ERROR:
-        emsg = prop.get_error()
-        error_dialog = dialogue.MessageDialog(parent,
-            Gtk.DialogFlags.DESTROY_WITH_PARENT,
-            Gtk.MessageType.ERROR,
-            Gtk.ButtonsType.CLOSE,
-            "Error printing: {}\n".format(emsg))
-        error_dialog.connect("response", lambda w,id: w.destroy())
-        error_dialog.show()
-    elif res == Gtk.PrintOperationResult.APPLY:
-        settings = prop.get_print_settings()
-        if settings.to_file(_USER_SETTINGS_FILE):
-            SETTINGS.load_file(_USER_SETTINGS_FILE)
+    _run_print_operation(prop, parent)
 
 def begin_print_markup_chunks(operation, context, data):
     """
-    Allocate the chunks to pages ready for printing.
-    """
-    pheight = context.get_height()
-    spwidth = int(context.get_width() * Pango.SCALE)
-    pages = []
-    page = []
-    total_height = 0
-    for chunk in data["chunks"]:
-        layout = context.create_pango_layout()
-        layout.set_width(spwidth)
-        layout.set_markup(chunk)
-        _twidth, theight = layout.get_pixel_size()
-        if total_height + theight < pheight:
-            page.append(layout)
-            total_height += theight
-        elif theight < pheight:
-            pages.append(page)
-            page = [layout]
-            total_height = theight
-        else:
-            # TODO: handle the case where a marked up chunk is too big for one page
-            pass
-    if page:
-        pages.append(page)
-    data["pages"] = pages
-    operation.set_n_pages(len(pages))
+    Set up the allocation of the chunks to pages.
+    """
+    data["paginator"] = MarkupChunkPaginator(data["chunks"], context.get_width(), context.get_height(), context.create_pango_layout())
+
+def paginate_markup_chunks(operation, context, data):
+    """
+    Process the "paginate" signal
+    """
+    paginator = data["paginator"]
+    if paginator.paginate_step():
+        operation.set_n_pages(len(paginator.pages))
+        return True
+    return False
 
 def draw_page_markup_chunks(operation, context, page_num, data):
     """
     Process the "draw-page" signal
     """
-    y = 0
-    for layout in data["pages"][page_num]:
-        cc = context.get_cairo_context()
-        cc.move_to(0, y)
-        PangoCairo.show_layout(cc, layout)
-        _w, h = layout.get_pixel_size()
-        y += h
+    data["paginator"].draw_page(context.get_cairo_context(), page_num)
 
-def print_pixbuf(pixbuf, parent=None):
+class PixbufPaginator:
+    """Draw a pixbuf either fitted onto a single page (rotated clockwise
+    if it is wider than it is tall) or, if units_per_pixel is given, at
+    that scale tiled across as many pages as are needed.  The scaling
+    is done by cairo transformations and the pixbuf is painted in bands
+    (of at most BAND_BYTES of pixel data) so that neither a scaled copy
+    nor a full size cairo surface copy of the pixbuf is ever made.
     """
-    Print a single pixbuf on one page.
+    BAND_BYTES = 4 << 20
+    def __init__(self, pixbuf, width, height, units_per_pixel=None):
+        self.pixbuf = pixbuf
+        self.width = width
+        self.height = height
+        self.units_per_pixel = units_per_pixel
+        if units_per_pixel is None:
+            self.pages = [(0, 0)]
+        else:
+            ncols = max(int(math.ceil(pixbuf.get_width() * units_per_pixel / width)), 1)
+            nrows = max(int(math.ceil(pixbuf.get_height() * units_per_pixel / height)), 1)
+            self.pages = [(col, row) for row in range(nrows) for col in range(ncols)]
+    def paginate(self):
+        return len(self.pages)
+    def _paint_region(self, cairo_context, x0, y0, x1, y1):
+        # NB: the cairo context's user space must be pixbuf pixels
+        band_rows = max(self.BAND_BYTES // self.pixbuf.get_rowstride(), 1)
+        for top in range(y0, y1, band_rows):
+            rows = min(band_rows, y1 - top)
+            band = self.pixbuf.new_subpixbuf(x0, top, x1 - x0, rows)
+            Gdk.cairo_set_source_pixbuf(cairo_context, band, x0, top)
+            pattern = cairo_context.get_source()
+            # padding stops the filter fading the band edges into seams
+            pattern.set_extend(cairo.EXTEND_PAD)
+            pattern.set_filter(cairo.FILTER_GOOD)
+            cairo_context.rectangle(x0, top, x1 - x0, rows)
+            cairo_context.fill()
+    def draw_page(self, cairo_context, page_num):
+        pwidth, pheight = self.pixbuf.get_width(), self.pixbuf.get_height()
+        cairo_context.save()
+        if self.units_per_pixel is None:
+            if pwidth > pheight:
+                scale = min(self.width / pheight, self.height / pwidth)
+                cairo_context.translate(pheight * scale, 0)
+                cairo_context.rotate(math.pi / 2)
+            else:
+                scale = min(self.width / pwidth, self.height / pheight)
+            cairo_context.scale(scale, scale)
+            self._paint_region(cairo_context, 0, 0, pwidth, pheight)
+        else:
+            col, row = self.pages[page_num]
+            cairo_context.rectangle(0, 0, self.width, self.height)
+            cairo_context.clip()
+            cairo_context.translate(-col * self.width, -row * self.height)
+            cairo_context.scale(self.units_per_pixel, self.units_per_pixel)
+            # only the pixels that appear on this page
+            x0 = int(math.floor(col * self.width / self.units_per_pixel))
+            y0 = int(math.floor(row * self.height / self.units_per_pixel))
+            x1 = min(int(math.ceil((col + 1) * self.width / self.units_per_pixel)), pwidth)
+            y1 = min(int(math.ceil((row + 1) * self.height / self.units_per_pixel)), pheight)
+            self._paint_region(cairo_context, x0, y0, x1, y1)
+        cairo_context.restore()
+
+def print_pixbuf(pixbuf, parent=None, resolution=None):
+    """
+    Print a single pixbuf on one page or, if resolution (in pixels per
+    inch) is given, at that resolution on as many pages as it needs.
     """
     prop = Gtk.PrintOperation()
     #
     prop.set_print_settings(SETTINGS)
     prop.set_unit(Gtk.Unit.MM)
     #
-    data = {"pixbuf" : pixbuf}
+    data = {"pixbuf" : pixbuf, "resolution" : resolution}
     #
     prop.connect( "begin-print", begin_print_pixbuf, data)
     prop.connect("draw-page", draw_page_pixbuf, data)
     #
-    res = prop.run(Gtk.PrintOperationAction.PRINT_DIALOG, parent)
-    #
-    if res == Gtk.PrintOperationResult.ERROR:
-        emsg = prop.get_error()
-        error_dialog = dialogue.MessageDialog(parent,
-            Gtk.DialogFlags.DESTROY_WITH_PARENT,
-            Gtk.MessageType.ERROR,
-            Gtk.ButtonsType.CLOSE,
-            "Error printing: {}\n".format(emsg))
-        error_dialog.connect("response", lambda w,id: w.destroy())
-        error_dialog.show()
-    elif res == Gtk.PrintOperationResult.APPLY:
-        settings = prop.get_print_settings()
-        if settings.to_file(_USER_SETTINGS_FILE):
-            SETTINGS.load_file(_USER_SETTINGS_FILE)
+    _run_print_operation(prop, parent)
 
 def begin_print_pixbuf(operation, context, data):
     """
-    Scale the  pixbuf to fit the page.
-    """
-    pheight = data["pixbuf"].get_height()
-    pwidth = data["pixbuf"].get_width()
-    psu = context.get_page_setup()
-    if pwidth > pheight:
-        data["pixbuf"] = data["pixbuf"].rotate_simple(Gdk.PIXBUF_ROTATE_CLOCKWISE)
-        pheight = data["pixbuf"].get_height()
-        pwidth = data["pixbuf"].get_width()
-    cheight = fractions.Fraction.from_float(context.get_height())
-    cwidth = fractions.Fraction.from_float(context.get_width())
-    hscale = fractions.Fraction(cheight, pheight)
-    wscale = fractions.Fraction(cwidth, pwidth)
-    if hscale < wscale:
-        new_width = int(round(pwidth * hscale))
-        new_height = int(round(pheight * hscale))
-    else:
-        new_width = int(round(pwidth * wscale))
-        new_height = int(round(pheight * wscale))
-    data["pixbuf"] = data["pixbuf"].scale_simple(new_width, new_height, GdkPixbuf.InterpType.BILINEAR)
-    operation.set_n_pages(1)
+    Work out how the pixbuf is to be fitted or tiled onto the pages.
+    """
+    units_per_pixel = None if data["resolution"] is None else 25.4 / data["resolution"]
+    data["paginator"] = PixbufPaginator(data["pixbuf"], context.get_width(), context.get_height(), units_per_pixel)
+    operation.set_n_pages(data["paginator"].paginate())
 
 def draw_page_pixbuf(operation, context, page_num, data):
     """
     Process the "draw-page" signal
     """
-    cc = context.get_cairo_context()
-    sfc = Gdk.cairo_surface_create_from_pixbuf(data["pixbuf"], 0, None)
-    cc.set_source_surface(sfc, 0, 0)
-    cc.paint()
+    data["paginator"].draw_page(context.get_cairo_context(), page_num)
+
+# Export (to PDF or PNG files) without a print dialog using the same
+# pagination as printing
+EXPORT_FORMATS = (".pdf", ".png")
+
+def default_page_setup():
+    """Return a page setup for the paper size in the print settings
+    (or the default paper size if there isn't one).
+    """
+    page_setup = Gtk.PageSetup()
+    paper_size = SETTINGS.get_paper_size()
+    if paper_size is not None:
+        page_setup.set_paper_size_and_default_margins(paper_size)
+    return page_setup
+
+def _page_setup_to_data(page_setup):
+    key_file = GLib.KeyFile()
+    page_setup.to_key_file(key_file, None)
+    return key_file.to_data()[0]
+
+def _page_setup_from_data(data):
+    key_file = GLib.KeyFile()
+    key_file.load_from_data(data, len(data.encode()), GLib.KeyFileFlags.NONE)
+    return Gtk.PageSetup.new_from_key_file(key_file, None)
+
+def _new_layout(cairo_context):
+    layout = PangoCairo.create_layout(cairo_context)
+    # NB: so that font sizes (in points) match the (point) user units
+    PangoCairo.context_set_resolution(layout.get_context(), 72)
+    return layout
+
+def _export_pages(make_paginator, file_path, page_setup=None, resolution=150):
+    """Render the pages of the paginator returned by
+    make_paginator(width, height, cairo_context) to file_path (a PDF
+    file or, for PNG, one file per page with the page number appended
+    when there is more than one) and return the list of files written.
+    """
+    root, ext = os.path.splitext(file_path)
+    ext = ext.lower()
+    assert ext in EXPORT_FORMATS, "{}: unsupported export format".format(file_path)
+    if page_setup is None:
+        page_setup = default_page_setup()
+    unit = Gtk.Unit.POINTS
+    paper_width, paper_height = page_setup.get_paper_width(unit), page_setup.get_paper_height(unit)
+    left, top = page_setup.get_left_margin(unit), page_setup.get_top_margin(unit)
+    width = paper_width - left - page_setup.get_right_margin(unit)
+    height = paper_height - top - page_setup.get_bottom_margin(unit)
+    if ext == ".pdf":
+        surface = cairo.PDFSurface(file_path, paper_width, paper_height)
+    else:
+        scale = resolution / 72
+        surface = cairo.ImageSurface(cairo.FORMAT_RGB24, int(math.ceil(paper_width * scale)), int(math.ceil(paper_height * scale)))
+    cairo_context = cairo.Context(surface)
+    if ext == ".png":
+        cairo_context.scale(scale, scale)
+    paginator = make_paginator(width, height, cairo_context)
+    npages = paginator.paginate()
+    file_paths = []
+    for page_num in range(npages):
+        if ext == ".png":
+            cairo_context.set_source_rgb(1.0, 1.0, 1.0)
+            cairo_context.paint()
+        cairo_context.set_source_rgb(0.0, 0.0, 0.0)
+        cairo_context.save()
+        cairo_context.translate(left, top)
+        paginator.draw_page(cairo_context, page_num)
+        cairo_context.restore()
+        if ext == ".pdf":
+            cairo_context.show_page()
+        else:
+            page_file_path = file_path if npages == 1 else "{}-{:03d}{}".format(root, page_num + 1, ext)
+            surface.write_to_png(page_file_path)
+            file_paths.append(page_file_path)
+    surface.finish()
+    return [file_path] if ext == ".pdf" else file_paths
+
+def export_text(text, file_path, page_setup=None, resolution=150):
+    """Export the text (a str or an iterable of lines) to file_path
+    and return the list of files written.
+    """
+    lines = text_lines(text)
+    try:
+        return _export_pages(lambda width, height, cc: TextPaginator(lines, width, height, _new_layout(cc)), file_path, page_setup, resolution)
+    finally:
+        lines.close()
+
+def export_markup_chunks(chunks, file_path, page_setup=None, resolution=150):
+    """Export the marked up chunks to file_path and return the list
+    of files written.
+    """
+    return _export_pages(lambda width, height, cc: MarkupChunkPaginator(chunks, width, height, _new_layout(cc)), file_path, page_setup, resolution)
+
+def export_pixbuf(pixbuf, file_path, page_setup=None, resolution=150, image_resolution=None):
+    """Export the pixbuf (or the image in the named file) to file_path
+    and return the list of files written.  If image_resolution (in
+    pixels per inch) is given the image is tiled across pages at that
+    resolution instead of being fitted onto one page.
+    """
+    if isinstance(pixbuf, str):
+        pixbuf = GdkPixbuf.Pixbuf.new_from_file(pixbuf)
+    units_per_pixel = None if image_resolution is None else 72 / image_resolution
+    return _export_pages(lambda width, height, cc: PixbufPaginator(pixbuf, width, height, units_per_pixel), file_path, page_setup, resolution)
+
+_EXPORTERS = {
+    "text": export_text,
+    "markup_chunks": export_markup_chunks,
+    "pixbuf": export_pixbuf,
+}
+
+def _export_job(kind, content, file_path, page_setup_data, resolution):
+    return _EXPORTERS[kind](content, file_path, _page_setup_from_data(page_setup_data), resolution)
+
+def export_documents(jobs, page_setup=None, resolution=150, processes=None):
+    """Export each of the (kind, content, file_path) jobs where kind is
+    "text", "markup_chunks" or "pixbuf" and return a list of the lists
+    of files written for each job.  If processes is given the jobs are
+    shared among that many worker processes in which case the content
+    must be picklable (i.e. not a generator or a pixbuf but pixbuf
+    content may be the name of an image file).
+    """
+    if page_setup is None:
+        page_setup = default_page_setup()
+    if not processes:
+        return [_EXPORTERS[kind](content, file_path, page_setup, resolution) for kind, content, file_path in jobs]
+    page_setup_data = _page_setup_to_data(page_setup)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(_export_job, kind, content, file_path, page_setup_data, resolution) for kind, content, file_path in jobs]
+        return [future.result() for future in futures]
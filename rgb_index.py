@@ -0,0 +1,127 @@
+#  Copyright 2017 Peter Williams <pwil3058@gmail.com>
+#
+# This software is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License only.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; if not, write to:
+#  The Free Software Foundation, Inc., 51 Franklin Street,
+#  Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Spatial index of colours for nearest match queries over palettes
+"""
+
+import heapq
+import itertools
+import math
+
+from . import rgb_math
+
+__all__ = []
+__author__ = "Peter Williams <pwil3058@gmail.com>"
+
+# The (x, y, value) coordinates of proportional RGBs lie in these ranges
+_COORD_RANGES = ((-1.0, 1.0), (-rgb_math.SIN_120, rgb_math.SIN_120), (0.0, 1.0))
+
+def rgb_coords(rgb, one=1.0):
+    """Return the (x, y, value) coordinates of rgb (scaled so that one
+    is the maximum component value) used for indexing.
+    Distances between these coordinates reflect differences in hue,
+    chroma and value.
+    """
+    x, y = rgb_math.rgb_to_xy(rgb)
+    return (x / one, y / one, rgb_math.rgb_value_numerator(rgb) / one)
+
+class RGBIndex:
+    """A uniform grid over (x, y, value) space holding keyed colours
+    that supports incremental insertion and deletion and k nearest and
+    within radius queries that only examine the grid cells near the
+    target colour.
+    """
+    def __init__(self, one=1.0, cell_size=1.0 / 16):
+        self.__one = one
+        self.__cell_size = cell_size
+        self.__cells = {}
+        self.__key_cells = {}
+        # NB: allow a cell's leeway for rounding errors
+        self.__bounds = [(self.__cell_index(lo) - 1, self.__cell_index(hi) + 1) for lo, hi in _COORD_RANGES]
+    def __cell_index(self, coord):
+        return int(math.floor(coord / self.__cell_size))
+    def __cell(self, coords):
+        return tuple(self.__cell_index(coord) for coord in coords)
+    def __len__(self):
+        return len(self.__key_cells)
+    def __contains__(self, key):
+        return key in self.__key_cells
+    def insert(self, key, rgb):
+        """Add rgb to the index under key (replacing any existing entry
+        for key).
+        """
+        if key in self.__key_cells:
+            self.delete(key)
+        coords = rgb_coords(rgb, self.__one)
+        cell = self.__cell(coords)
+        self.__cells.setdefault(cell, {})[key] = coords
+        self.__key_cells[key] = cell
+    def delete(self, key):
+        cell = self.__key_cells.pop(key)
+        contents = self.__cells[cell]
+        del contents[key]
+        if not contents:
+            del self.__cells[cell]
+    def __ring(self, centre, radius):
+        # the cells whose Chebyshev distance from centre is radius
+        (ilo, ihi), (jlo, jhi), (klo, khi) = self.__bounds
+        ci, cj, ck = centre
+        all_k = range(max(ck - radius, klo), min(ck + radius, khi) + 1)
+        end_k = [k for k in {ck - radius, ck + radius} if klo <= k <= khi]
+        for i in range(max(ci - radius, ilo), min(ci + radius, ihi) + 1):
+            i_edge = abs(i - ci) == radius
+            for j in range(max(cj - radius, jlo), min(cj + radius, jhi) + 1):
+                for k in all_k if i_edge or abs(j - cj) == radius else end_k:
+                    yield (i, j, k)
+    def __max_ring(self, centre):
+        return max(max(abs(index - lo), abs(hi - index)) for index, (lo, hi) in zip(centre, self.__bounds))
+    def nearest(self, rgb, k=1):
+        """Return a list of (distance, key) pairs for the k entries
+        nearest to rgb in order of increasing distance.
+        """
+        coords = rgb_coords(rgb, self.__one)
+        centre = self.__cell(coords)
+        found = [] # a max heap (via negated distances) of the best k
+        tie_breaker = itertools.count() # keys needn't be comparable
+        for radius in range(self.__max_ring(centre) + 1):
+            for cell in self.__ring(centre, radius):
+                for key, other in self.__cells.get(cell, {}).items():
+                    distance = math.sqrt(sum((a - b) ** 2 for a, b in zip(coords, other)))
+                    if len(found) < k:
+                        heapq.heappush(found, (-distance, next(tie_breaker), key))
+                    elif distance < -found[0][0]:
+                        heapq.heapreplace(found, (-distance, next(tie_breaker), key))
+            # entries in cells further out are at least this far away
+            if len(found) == k and -found[0][0] <= radius * self.__cell_size:
+                break
+        return sorted(((-neg_distance, key) for neg_distance, _seq, key in found), key=lambda item: item[0])
+    def within(self, rgb, radius):
+        """Return a list of (distance, key) pairs for the entries within
+        radius of rgb in order of increasing distance.
+        """
+        coords = rgb_coords(rgb, self.__one)
+        ranges = [range(self.__cell_index(coord - radius), self.__cell_index(coord + radius) + 1) for coord in coords]
+        if len(ranges[0]) * len(ranges[1]) * len(ranges[2]) < len(self.__cells):
+            cells = ((i, j, k) for i in ranges[0] for j in ranges[1] for k in ranges[2])
+        else:
+            cells = (cell for cell in list(self.__cells) if all(index in rnge for index, rnge in zip(cell, ranges)))
+        result = []
+        for cell in cells:
+            for key, other in self.__cells.get(cell, {}).items():
+                distance = math.sqrt(sum((a - b) ** 2 for a, b in zip(coords, other)))
+                if distance <= radius:
+                    result.append((distance, key))
+        return sorted(result, key=lambda item: item[0])
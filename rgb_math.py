@@ -19,6 +19,7 @@
 
 import array
 import collections
+import functools
 import math
 
 from ..bab import mathx
@@ -114,6 +115,91 @@ def rotate_rgb(rgb, delta_hue_angle):
     except TypeError:
         return rgb.__class__(*rtd_rgb)
 
+# Fixed point integer fast paths for flat buffers (array.array or
+# memoryview) of 8 and 16 bit ("B" and "H") RGB data.  Results are
+# written straight into "out" (allocated if not supplied).
+FIXED_POINT_SHIFT = 16
+_FIXED_POINT_ONE = 1 << FIXED_POINT_SHIFT
+_FIXED_POINT_HALF = 1 << (FIXED_POINT_SHIFT - 1)
+
+def _buffer_typecode(buf):
+    typecode = buf.typecode if hasattr(buf, "typecode") else buf.format
+    assert typecode in ["B", "H"], "{}: fixed point requires 8 or 16 bit components".format(typecode)
+    return typecode
+
+def _new_array(typecode, length):
+    return array.array(typecode, bytes(length * array.array(typecode).itemsize))
+
+def int_rgbs_values(rgbs, out=None):
+    """Write the values (rounded to the nearest integer in component
+    units) of the RGBs in the flat buffer rgbs into out and return out.
+    """
+    typecode = _buffer_typecode(rgbs)
+    if out is None:
+        out = _new_array(typecode, len(rgbs) // 3)
+    j = 0
+    for i in range(0, len(rgbs), 3):
+        out[j] = (rgbs[i] + rgbs[i + 1] + rgbs[i + 2] + 1) // 3
+        j += 1
+    return out
+
+def int_rgbs_xy(rgbs, out=None):
+    """Write the cartesian coordinates of the RGBs in the flat buffer
+    rgbs into out (as x, y pairs of fixed point integers scaled by
+    2 ** FIXED_POINT_SHIFT) and return out.
+    NB x is exact and y has a relative error of less than 3e-6.
+    """
+    _buffer_typecode(rgbs)
+    if out is None:
+        out = _new_array("q", (len(rgbs) // 3) * 2)
+    x_shift = FIXED_POINT_SHIFT - 1
+    y_scale = int(SIN_120 * _FIXED_POINT_ONE + 0.5)
+    j = 0
+    for i in range(0, len(rgbs), 3):
+        red, green, blue = rgbs[i], rgbs[i + 1], rgbs[i + 2]
+        out[j] = (2 * red - green - blue) << x_shift
+        out[j + 1] = (green - blue) * y_scale
+        j += 2
+    return out
+
+def int_rotate_rgbs(rgbs, delta_hue_angle, out=None):
+    """Write the RGBs in the flat buffer rgbs rotated by the specified
+    hue angle (as per rotate_rgb()) into out and return out.  out may
+    be rgbs for in place rotation.
+    NB rounding of the (fixed point) coefficients means that components
+    may differ from those produced by rotate_rgb() by one unit.
+    """
+    def calc_k1(delta_hue_angle):
+        a = math.sin(delta_hue_angle)
+        b = math.sin(mathx.PI_120 - delta_hue_angle)
+        return int(b / (a + b) * _FIXED_POINT_ONE + 0.5)
+    typecode = _buffer_typecode(rgbs)
+    if out is None:
+        out = _new_array(typecode, len(rgbs))
+    if delta_hue_angle > 0:
+        if delta_hue_angle > mathx.PI_120:
+            k1, (c1r, c1g, c1b), (c2r, c2g, c2b) = calc_k1(delta_hue_angle - mathx.PI_120), (2, 0, 1), (1, 2, 0)
+        else:
+            k1, (c1r, c1g, c1b), (c2r, c2g, c2b) = calc_k1(delta_hue_angle), (0, 1, 2), (2, 0, 1)
+    elif delta_hue_angle < 0:
+        if delta_hue_angle < -mathx.PI_120:
+            k1, (c1r, c1g, c1b), (c2r, c2g, c2b) = calc_k1(abs(delta_hue_angle) - mathx.PI_120), (1, 2, 0), (2, 0, 1)
+        else:
+            k1, (c1r, c1g, c1b), (c2r, c2g, c2b) = calc_k1(abs(delta_hue_angle)), (0, 1, 2), (1, 2, 0)
+    else:
+        if out is not rgbs:
+            out[:] = rgbs[:]
+        return out
+    # k1 + k2 == one guarantees that the results are in range
+    k2 = _FIXED_POINT_ONE - k1
+    shift, half = FIXED_POINT_SHIFT, _FIXED_POINT_HALF
+    for i in range(0, len(rgbs), 3):
+        rgb = rgbs[i], rgbs[i + 1], rgbs[i + 2]
+        out[i] = (rgb[c1r] * k1 + rgb[c2r] * k2 + half) >> shift
+        out[i + 1] = (rgb[c1g] * k1 + rgb[c2g] * k2 + half) >> shift
+        out[i + 2] = (rgb[c1b] * k1 + rgb[c2b] * k2 + half) >> shift
+    return out
+
 def rgb_hue_angle(rgb):
     """Return the hue angle for the given rgb.
     Angle returned is the angle between pure red (0 radians) and the hue
@@ -206,6 +292,70 @@ def xy_to_rgb(x, y):
         return RGB(x, 0.0, 0.0)
 
 
+def _calc_other(oa):
+    """Return the value of the middle component of the max chroma RGB
+    where oa is the angle (in the range 0 to PI_60) from the nearest
+    primary.
+    """
+    if oa in [mathx.PI_60, mathx.PI_180]:
+        return 1.0
+    return math.sin(oa) / math.sin(mathx.PI_120 - oa)
+
+_OTHER_LUT = None
+_OTHER_LUT_SCALE = None
+
+def _lut_other(oa):
+    # linear interpolation between the bins on either side of oa
+    posn = oa * _OTHER_LUT_SCALE
+    index = min(int(posn), len(_OTHER_LUT) - 2)
+    lower = _OTHER_LUT[index]
+    return lower + (_OTHER_LUT[index + 1] - lower) * (posn - index)
+
+def set_hue_lut_size(nbins):
+    """Make HueAngle calculate max chroma RGBs and chroma corrections
+    by linear interpolation in a table of nbins bins (covering the
+    range between a primary and its adjacent secondary) rather than
+    using trigonometry.  Use nbins == 0 to turn the table off.
+    The interpolation error in the non extreme max chroma RGB component
+    is bounded by 0.19 / (nbins * nbins) (e.g. 1.1e-8 for 4096 bins
+    and 4.3e-11 for 65536 bins) and the error in the chroma correction
+    is bounded by half that.
+    """
+    global _OTHER_LUT, _OTHER_LUT_SCALE
+    if nbins:
+        step = mathx.PI_60 / nbins
+        _OTHER_LUT = array.array("d", [_calc_other(i * step) for i in range(nbins)] + [1.0])
+        _OTHER_LUT_SCALE = nbins / mathx.PI_60
+    else:
+        _OTHER_LUT = _OTHER_LUT_SCALE = None
+    clear_caches()
+
+def clear_caches():
+    """Discard any cached hue calculations (e.g. before timing them).
+    """
+    _hue_max_chroma_rgb_and_correction.cache_clear()
+
+HUE_CACHE_SIZE = 4096
+
+@functools.lru_cache(maxsize=HUE_CACHE_SIZE)
+def _hue_max_chroma_rgb_and_correction(angle):
+    """Return the max chroma PRGB and chroma correction for the
+    (normalized and non NaN) hue angle (cached as colour wheels,
+    palettes etc. tend to use the same hues repeatedly).
+    """
+    calc_other = _calc_other if _OTHER_LUT is None else _lut_other
+    aha = abs(angle)
+    if aha <= mathx.PI_60:
+        other = calc_other(aha)
+        max_chroma_rgb = PRGB(1.0, other, 0.0) if angle >= 0 else PRGB(1.0, 0.0, other)
+    elif aha <= mathx.PI_120:
+        other = calc_other(mathx.PI_120 - aha)
+        max_chroma_rgb = PRGB(other, 1.0, 0.0) if angle >= 0 else PRGB(other, 0.0, 1.0)
+    else:
+        other = calc_other(aha - mathx.PI_120)
+        max_chroma_rgb = PRGB(0.0, 1.0, other) if angle >= 0 else PRGB(0.0, other, 1.0)
+    return (max_chroma_rgb, 1.0 / math.sqrt(1.0 + other * other - other))
+
 class HueAngle:
     __slots__ = ["__angle", "__max_chroma_rgb", "__chroma_correction"]
     def __init__(self, angle):
@@ -214,22 +364,9 @@ class HueAngle:
             self.__max_chroma_rgb = PRGB(1.0, 1.0, 1.0)
             self.__chroma_correction = 1.0
         else:
-            aha = abs(angle)
+            # NB: use the normalized angle e.g. for the results of rotated_by()
             self.__angle = mathx.Angle(angle)
-            def calc_other(oa):
-                if oa in [mathx.PI_60, mathx.PI_180]:
-                    return 1.0
-                return math.sin(oa) / math.sin(mathx.PI_120 - oa)
-            if aha <= mathx.PI_60:
-                other = calc_other(aha)
-                self.__max_chroma_rgb = PRGB(1.0, other, 0.0) if angle >= 0 else PRGB(1.0, 0.0, other)
-            elif aha <= mathx.PI_120:
-                other = calc_other(mathx.PI_120 - aha)
-                self.__max_chroma_rgb = PRGB(other, 1.0, 0.0) if angle >= 0 else PRGB(other, 0.0, 1.0)
-            else:
-                other = calc_other(aha - mathx.PI_120)
-                self.__max_chroma_rgb = PRGB(0.0, 1.0, other) if angle >= 0 else PRGB(0.0, other, 1.0)
-            self.__chroma_correction = 1.0 / math.sqrt(1.0 + other * other - other)
+            self.__max_chroma_rgb, self.__chroma_correction = _hue_max_chroma_rgb_and_correction(float(self.__angle))
     def __float__(self):
         return self.__angle
     @classmethod
@@ -0,0 +1,445 @@
+#  Copyright 2017 Peter Williams <pwil3058@gmail.com>
+#
+# This software is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License only.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; if not, write to:
+#  The Free Software Foundation, Inc., 51 Franklin Street,
+#  Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Vectorized (NumPy) versions of the rgb_math routines for operating on
+many colours at once.  The colours are supplied as an (N, 3) array (or
+anything that can be turned into one e.g. a flat array.array) or any
+other array whose last axis holds the RGB components (e.g. a
+(height, width, 3) view of pixel data) whose item type is one of those
+in rgb_math.ARRAY_ONE and the results match those of the equivalent
+scalar functions to within float tolerance.
+NB check AVAILABLE before use as NumPy is an optional dependency.
+"""
+
+import array
+import math
+
+try:
+    import numpy
+    AVAILABLE = True
+except ImportError:
+    AVAILABLE = False
+
+from ..bab import mathx
+
+from .rgb_math import ARRAY_ONE, COS_120, SIN_120
+
+__all__ = []
+__author__ = "Peter Williams <pwil3058@gmail.com>"
+
+def as_rgb_ndarray(rgbs, typecode=None):
+    """Return rgbs as a numpy array whose last axis holds the RGB
+    components (sharing rgbs' memory where possible) and the
+    rgb_math.ARRAY_ONE typecode of its items.  Flat sequences are
+    treated as (N, 3) arrays.
+    """
+    if isinstance(rgbs, array.array):
+        typecode = rgbs.typecode
+        ndarray = numpy.frombuffer(rgbs, dtype=typecode)
+    else:
+        ndarray = numpy.asarray(rgbs, dtype=typecode)
+        typecode = ndarray.dtype.char
+    assert typecode in ARRAY_ONE, "{}: unsupported array typecode".format(typecode)
+    if ndarray.ndim == 1:
+        ndarray = ndarray.reshape(-1, 3)
+    assert ndarray.shape[-1] == 3, "{}: RGBs must be in the last axis".format(ndarray.shape)
+    return ndarray, typecode
+
+def _float_rgbs(rgbs):
+    # NB: this is a (float64) copy as the colour maths is done in floats
+    ndarray, typecode = as_rgb_ndarray(rgbs)
+    return ndarray.astype(numpy.float64), ARRAY_ONE[typecode]
+
+def rgbs_to_xy(rgbs):
+    """Return the cartesian coordinates for rgbs as an (N, 2) array (or
+    (..., 2) array as appropriate)
+    """
+    frgbs, _one = _float_rgbs(rgbs)
+    return _xy(frgbs)
+
+def _xy(frgbs):
+    xy = numpy.empty(frgbs.shape[:-1] + (2,))
+    xy[..., 0] = frgbs[..., 0] + COS_120 * (frgbs[..., 1] + frgbs[..., 2])
+    xy[..., 1] = SIN_120 * (frgbs[..., 1] - frgbs[..., 2])
+    return xy
+
+def _xy_hue_angles(xy):
+    with numpy.errstate(invalid="ignore"):
+        angles = numpy.arctan2(xy[..., 1], xy[..., 0])
+    angles[(xy[..., 0] == 0.0) & (xy[..., 1] == 0.0)] = numpy.nan
+    return angles
+
+def hue_angles(rgbs):
+    """Return the hue angles (in radians) for rgbs with NaN for greys.
+    """
+    frgbs, _one = _float_rgbs(rgbs)
+    return _xy_hue_angles(_xy(frgbs))
+
+def _others(aha):
+    # the value of the non extreme component of the max chroma RGBs
+    with numpy.errstate(invalid="ignore"):
+        oa = numpy.where(aha <= mathx.PI_60, aha, numpy.where(aha <= mathx.PI_120, mathx.PI_120 - aha, aha - mathx.PI_120))
+        others = numpy.sin(oa) / numpy.sin(mathx.PI_120 - oa)
+        others[(oa == mathx.PI_60) | (oa == mathx.PI_180)] = 1.0
+    return others
+
+def chroma_corrections(angles):
+    """Return the chroma correction factors (as per HueAngle) for the
+    given hue angles.
+    """
+    aha = numpy.abs(numpy.asarray(angles, dtype=numpy.float64))
+    others = _others(aha)
+    with numpy.errstate(invalid="ignore"):
+        corrections = 1.0 / numpy.sqrt(1.0 + others * others - others)
+    corrections[numpy.isnan(aha)] = 1.0
+    return corrections
+
+# (one, other, zero) component indices of the max chroma RGBs for each
+# sextant (in the order low, mid, high) and sign of the hue angle
+_MAX_CHROMA_LAYOUT = (
+    ((0, 1, 2), (0, 2, 1)),
+    ((1, 0, 2), (2, 0, 1)),
+    ((1, 2, 0), (2, 1, 0)),
+)
+
+def max_chroma_prgbs(angles):
+    """Return the maximum chroma PRGBs (as per HueAngle) for the given
+    hue angles as an (N, 3) array.
+    """
+    angles = numpy.asarray(angles, dtype=numpy.float64)
+    aha = numpy.abs(angles)
+    others = _others(aha)
+    prgbs = numpy.ones(angles.shape + (3,))
+    with numpy.errstate(invalid="ignore"):
+        low = aha <= mathx.PI_60
+        sextants = (low, ~low & (aha <= mathx.PI_120), aha > mathx.PI_120)
+        positive = angles >= 0
+    for sextant, layouts in zip(sextants, _MAX_CHROMA_LAYOUT):
+        for sel, (one, other, zero) in zip((sextant & positive, sextant & ~positive), layouts):
+            prgbs[sel, one] = 1.0
+            prgbs[sel, other] = others[sel]
+            prgbs[sel, zero] = 0.0
+    return prgbs
+
+def value_numerators(rgbs):
+    """Return the enumerators of rgbs' values (as floats).
+    """
+    frgbs, _one = _float_rgbs(rgbs)
+    return frgbs.sum(axis=-1) / 3
+
+def chroma_numerators(rgbs):
+    """Return the enumerators of rgbs' chromas (as floats).
+    """
+    frgbs, _one = _float_rgbs(rgbs)
+    xy = _xy(frgbs)
+    return numpy.hypot(xy[..., 0], xy[..., 1]) * chroma_corrections(_xy_hue_angles(xy))
+
+def warmth_numerators(rgbs):
+    """Return the enumerators of rgbs' warmths (as floats).
+    """
+    frgbs, _one = _float_rgbs(rgbs)
+    return frgbs[..., 0] + COS_120 * (frgbs[..., 1] + frgbs[..., 2])
+
+def values(rgbs):
+    return value_numerators(rgbs) / ARRAY_ONE[as_rgb_ndarray(rgbs)[1]]
+
+def chromas(rgbs):
+    return chroma_numerators(rgbs) / ARRAY_ONE[as_rgb_ndarray(rgbs)[1]]
+
+def warmths(rgbs):
+    return warmth_numerators(rgbs) / ARRAY_ONE[as_rgb_ndarray(rgbs)[1]]
+
+def hue_value_chroma_warmth(rgbs):
+    """Return the hue angles, values, chromas and warmths for rgbs (as
+    proportions) calculated in a single pass.
+    """
+    frgbs, one = _float_rgbs(rgbs)
+    xy = _xy(frgbs)
+    angles = _xy_hue_angles(xy)
+    chromas = numpy.hypot(xy[..., 0], xy[..., 1]) * chroma_corrections(angles) / one
+    return angles, frgbs.sum(axis=-1) / (3 * one), chromas, xy[..., 0] / one
+
+def xy_to_rgbs(xy):
+    """Return the RGBs (as an (N, 3) float array) with at most 2 non-zero
+    components that match the (N, 2) array of x and y coordinates.
+    NB as per rgb_math.xy_to_rgb() this is not the inverse of rgbs_to_xy().
+    """
+    x = xy[..., 0]
+    y = xy[..., 1]
+    a = x / COS_120
+    b = y / SIN_120
+    rgbs = numpy.zeros(xy.shape[:-1] + (3,))
+    # the (default) case where red is zero
+    rgbs[..., 1] = (a + b) / 2
+    rgbs[..., 2] = (a - b) / 2
+    sel = (y > 0.0) & (a <= b)
+    rgbs[sel] = numpy.stack((x - b * COS_120, b, numpy.zeros_like(b)), axis=-1)[sel]
+    sel = (y < 0.0) & (a <= -b)
+    rgbs[sel] = numpy.stack((x + b * COS_120, numpy.zeros_like(b), -b), axis=-1)[sel]
+    sel = (y == 0.0) & (x >= 0.0)
+    rgbs[sel] = numpy.stack((x, numpy.zeros_like(x), numpy.zeros_like(x)), axis=-1)[sel]
+    return rgbs
+
+def _normalized_angles(angles):
+    return numpy.remainder(angles + mathx.PI_180, 2 * mathx.PI_180) - mathx.PI_180
+
+def prgbs_with_chroma(angles, req_chromas):
+    """Return the (dark side) PRGBs with the given hue angles and chromas
+    (as per HueAngle.prgb_with_chroma()).
+    """
+    req_hypots = req_chromas / chroma_corrections(angles)
+    xy = numpy.stack((req_hypots * numpy.cos(angles), req_hypots * numpy.sin(angles)), axis=-1)
+    prgbs = xy_to_rgbs(xy)
+    prgbs[req_chromas == 0] = 0.0
+    return prgbs
+
+def max_chromas_for_values(angles, values):
+    """Return the maximum chromas that can be achieved for RGBs with the
+    given hue angles and values (as per HueAngle.max_chroma_for_value()).
+    """
+    aha = numpy.abs(angles)
+    totals = values * 3.0
+    mcts = max_chroma_prgbs(angles).sum(axis=-1)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        light = ((3.0 - totals) / (2.0 * numpy.cos(numpy.where(aha < mathx.PI_60, aha, aha - mathx.PI_120)))) * chroma_corrections(angles)
+        chromas = numpy.where(mcts > totals, totals / mcts, light)
+    chromas[numpy.isnan(angles)] = 0.0
+    return chromas
+
+def max_chroma_prgbs_with_values(angles, req_values):
+    """Return the PRGBs with the given hue angles and values and the
+    maximum chroma possible for each combination (as per
+    HueAngle.max_chroma_prgb_with_value()).
+    """
+    shape = numpy.shape(angles)
+    angles = numpy.ravel(angles)
+    req_values = numpy.ravel(req_values)
+    mc_prgbs = max_chroma_prgbs(angles)
+    req_totals = req_values * 3
+    cur_totals = mc_prgbs.sum(axis=1)
+    shortfalls = req_totals - cur_totals
+    prgbs = mc_prgbs.copy()
+    dark = shortfalls < 0.0
+    prgbs[dark] = mc_prgbs[dark] * (req_totals[dark] / cur_totals[dark])[:, None]
+    # make up the shortfall by working out the weakest component first
+    light = numpy.flatnonzero(shortfalls > 0.0)
+    order = numpy.argsort(-mc_prgbs[light], axis=1, kind="stable")
+    others = mc_prgbs[light, order[:, 1]]
+    weakest = shortfalls[light] / (2.0 - others)
+    prgbs[light, order[:, 0]] = 1.0
+    prgbs[light, order[:, 2]] = weakest
+    prgbs[light, order[:, 1]] = others + shortfalls[light] - weakest
+    greys = numpy.isnan(angles)
+    prgbs[greys] = req_values[greys, None]
+    return prgbs.reshape(shape + (3,))
+
+def prgbs_to_ndarray(prgbs, typecode):
+    """Return the (N, 3) float array of PRGBs as an array of the given
+    typecode (rounded to nearest for integer types).
+    """
+    one = ARRAY_ONE[typecode]
+    if typecode in ["f", "d"]:
+        return (prgbs * one).astype(typecode)
+    return numpy.floor(prgbs * one + 0.5).astype(typecode)
+
+def _like_input(ndarray, rgbs):
+    if isinstance(rgbs, array.array):
+        return array.array(rgbs.typecode, ndarray.tobytes())
+    return ndarray
+
+def rotate_rgbs(rgbs, delta_hue_angle, out=None):
+    """Return a copy of rgbs with the same values but the hue angles
+    rotated by the specified amount (as per rgb_math.rotate_rgb()) with
+    the same item type (and container type) as rgbs.  If out is given
+    the result is written into it (which may be rgbs itself for an in
+    place rotation) and it is returned instead.
+    NB: the rotation is calculated on a float64 copy of rgbs.
+    """
+    def calc_ks(delta_hue_angle):
+        a = math.sin(delta_hue_angle)
+        b = math.sin(mathx.PI_120 - delta_hue_angle)
+        c = a + b
+        return (b / c, a / c)
+    ndarray, typecode = as_rgb_ndarray(rgbs)
+    if delta_hue_angle > 0:
+        if delta_hue_angle > mathx.PI_120:
+            (k1, k2), c1s, c2s = calc_ks(delta_hue_angle - mathx.PI_120), [2, 0, 1], [1, 2, 0]
+        else:
+            (k1, k2), c1s, c2s = calc_ks(delta_hue_angle), [0, 1, 2], [2, 0, 1]
+    elif delta_hue_angle < 0:
+        if delta_hue_angle < -mathx.PI_120:
+            (k1, k2), c1s, c2s = calc_ks(abs(delta_hue_angle) - mathx.PI_120), [1, 2, 0], [2, 0, 1]
+        else:
+            (k1, k2), c1s, c2s = calc_ks(abs(delta_hue_angle)), [0, 1, 2], [1, 2, 0]
+    else:
+        k1, k2, c1s, c2s = 1.0, 0.0, [0, 1, 2], [0, 1, 2]
+    frgbs = ndarray.astype(numpy.float64)
+    rotated = frgbs[..., c1s] * k1 + frgbs[..., c2s] * k2
+    if typecode not in ["f", "d"]:
+        rotated = numpy.floor(rotated + 0.5)
+    if out is not None:
+        as_rgb_ndarray(out)[0][...] = rotated
+        return out
+    return _like_input(rotated.astype(typecode), rgbs)
+
+class PaletteManipulator:
+    """Apply the RGBManipulator hue, value and chroma adjustments to
+    a whole array of colours at once.
+    """
+    def __init__(self, rgbs):
+        self.set_rgbs(rgbs)
+    def set_rgbs(self, rgbs):
+        ndarray, self.__typecode = as_rgb_ndarray(rgbs)
+        self.__as_array = isinstance(rgbs, array.array)
+        self.__shape = ndarray.shape
+        self.__set_prgbs(ndarray.reshape(-1, 3).astype(numpy.float64) / ARRAY_ONE[self.__typecode])
+        self.__last_hues = self.__hues.copy()
+    def __set_prgbs(self, prgbs):
+        self.__prgbs = prgbs
+        self.__values = prgbs.sum(axis=1) / 3
+        self.__xy = _xy(prgbs)
+        self.__base_rgbs = xy_to_rgbs(self.__xy)
+        self.__hues = _xy_hue_angles(self.__xy)
+        self.__chromas = numpy.minimum(numpy.hypot(self.__xy[:, 0], self.__xy[:, 1]) * chroma_corrections(self.__hues), 1.0)
+    def __len__(self):
+        return self.__prgbs.shape[0]
+    def get_rgbs(self, out=None):
+        """Return the manipulated colours in the same form as they were
+        supplied or write them into out (e.g. the pixel data they came
+        from) and return that.
+        """
+        ndarray = prgbs_to_ndarray(self.__prgbs, self.__typecode).reshape(self.__shape)
+        if out is not None:
+            as_rgb_ndarray(out)[0][...] = ndarray
+            return out
+        return array.array(self.__typecode, ndarray.tobytes()) if self.__as_array else ndarray
+    @property
+    def hues(self):
+        return self.__hues
+    @property
+    def values(self):
+        return self.__values
+    @property
+    def chromas(self):
+        return self.__chromas
+    @staticmethod
+    def _prgbs_from_values(hues, new_values):
+        new_base_rgbs = prgbs_with_chroma(hues, max_chromas_for_values(hues, new_values))
+        return new_base_rgbs + (new_values - new_base_rgbs.sum(axis=1) / 3)[:, None]
+    def _prgbs_from_chromas(self, sel, new_chromas):
+        new_base_rgbs = self.__base_rgbs[sel] * (new_chromas / self.__chromas[sel])[:, None]
+        deltas = numpy.minimum(1.0 - new_base_rgbs.max(axis=1), self.__values[sel] - new_base_rgbs.sum(axis=1) / 3)
+        return new_base_rgbs + numpy.maximum(deltas, 0.0)[:, None]
+    def decr_value(self, deltav):
+        """Decrease the values of all colours by deltav and return a
+        boolean array indicating which colours were changed.
+        """
+        changed = self.__values > 0.0
+        new_values = numpy.maximum(0.0, self.__values - deltav)
+        min_values = self.__base_rgbs.sum(axis=1) / 3
+        black = changed & (new_values == 0.0)
+        hard = changed & ~black & (new_values < min_values)
+        easy = changed & ~black & ~hard
+        prgbs = self.__prgbs.copy()
+        prgbs[black] = 0.0
+        prgbs[hard] = self._prgbs_from_values(self.__hues[hard], new_values[hard])
+        prgbs[easy] = self.__base_rgbs[easy] + (new_values[easy] - min_values[easy])[:, None]
+        self.__set_prgbs(prgbs)
+        return changed
+    def incr_value(self, deltav):
+        """Increase the values of all colours by deltav and return a
+        boolean array indicating which colours were changed.
+        """
+        changed = self.__values < 1.0
+        new_values = numpy.minimum(1.0, self.__values + deltav)
+        min_values = self.__base_rgbs.sum(axis=1) / 3
+        max_values = min_values + 1.0 - self.__base_rgbs.max(axis=1)
+        white = changed & (new_values >= 1.0)
+        hard = changed & ~white & (new_values > max_values)
+        easy = changed & ~white & ~hard
+        prgbs = self.__prgbs.copy()
+        prgbs[white] = 1.0
+        prgbs[hard] = self._prgbs_from_values(self.__hues[hard], new_values[hard])
+        prgbs[easy] = self.__base_rgbs[easy] + (new_values[easy] - min_values[easy])[:, None]
+        self.__set_prgbs(prgbs)
+        return changed
+    def decr_chroma(self, deltac):
+        """Decrease the chromas of all colours by deltac and return a
+        boolean array indicating which colours were changed.
+        """
+        changed = self.__chromas > 0.0
+        prgbs = self.__prgbs.copy()
+        prgbs[changed] = self._prgbs_from_chromas(changed, numpy.maximum(0.0, self.__chromas[changed] - deltac))
+        self.__set_prgbs(prgbs)
+        return changed
+    def incr_chroma(self, deltac):
+        """Increase the chromas of all colours by deltac and return a
+        boolean array indicating which colours were changed.
+        Greys acquire their last known hue (or any old hue if they've
+        never had one).
+        """
+        changed = self.__chromas < 1.0
+        greys = changed & numpy.isnan(self.__hues)
+        chromatic = changed & ~greys
+        prgbs = self.__prgbs.copy()
+        prgbs[chromatic] = self._prgbs_from_chromas(chromatic, numpy.minimum(1.0, self.__chromas[chromatic] + deltac))
+        if greys.any():
+            last_hues = self.__last_hues[greys]
+            values = self.__values[greys]
+            hues = numpy.where(numpy.isnan(last_hues), 0.5, last_hues)
+            extremes = (values <= 0.0) | (values >= 1.0)
+            req_chromas = numpy.where(extremes, deltac, numpy.minimum(deltac, numpy.where(numpy.isnan(last_hues), values, max_chromas_for_values(hues, values))))
+            new_base_rgbs = prgbs_with_chroma(hues, req_chromas)
+            deltas = numpy.where(extremes, numpy.where(values <= 0.0, 0.0, 1.0 - new_base_rgbs.max(axis=1)), values - new_base_rgbs.sum(axis=1) / 3)
+            prgbs[greys] = new_base_rgbs + deltas[:, None]
+        self.__set_prgbs(prgbs)
+        self.__last_hues[greys] = self.__hues[greys]
+        return changed
+    def rotate_hue(self, deltah):
+        """Rotate the hues of all colours by deltah keeping the same
+        chroma (and value where possible) and return a boolean array
+        indicating which colours were changed (i.e. weren't grey).
+        """
+        changed = ~numpy.isnan(self.__hues)
+        new_base_rgbs = prgbs_with_chroma(_normalized_angles(self.__hues[changed] + deltah), self.__chromas[changed])
+        deltas = numpy.minimum(1.0 - new_base_rgbs.max(axis=1), self.__values[changed] - new_base_rgbs.sum(axis=1) / 3)
+        prgbs = self.__prgbs.copy()
+        prgbs[changed] = new_base_rgbs + numpy.maximum(deltas, 0.0)[:, None]
+        self.__set_prgbs(prgbs)
+        self.__last_hues[changed] = self.__hues[changed]
+        return changed
+
+def pixel_rgbs_view(buf, width, height, rowstride, n_channels=3, typecode="B", offset=0):
+    """Return a (height, width, 3) array viewing (i.e. not copying) the
+    RGB channels of the pixel data in buf (anything supporting the
+    buffer protocol e.g. bytes, bytearray or memoryview) where rowstride
+    is in bytes and the RGB channels are the first 3 of n_channels.
+    The view is writable if buf is so the colour adjusting functions
+    (with out=view) can write their results back into the pixel data
+    (NB: their calculations are done on float64 copies).
+    """
+    itemsize = numpy.dtype(typecode).itemsize
+    return numpy.ndarray((height, width, 3), dtype=typecode, buffer=buf, offset=offset, strides=(rowstride, n_channels * itemsize, itemsize))
+
+def pixbuf_rgbs_view(pixbuf):
+    """Return a read only (height, width, 3) view of a snapshot of the
+    RGB pixel data in the GdkPixbuf.Pixbuf pixbuf (e.g. for working out
+    the hues, values and chromas of its pixels).
+    NB: Pixbuf.get_pixels() returns a copy of the pixel data so changes
+    to the pixbuf aren't seen by the view (and vice versa).
+    """
+    assert pixbuf.get_bits_per_sample() == 8
+    return pixel_rgbs_view(pixbuf.get_pixels(), pixbuf.get_width(), pixbuf.get_height(), pixbuf.get_rowstride(), pixbuf.get_n_channels())
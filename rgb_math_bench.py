@@ -0,0 +1,283 @@
+#  Copyright 2017 Peter Williams <pwil3058@gmail.com>
+#
+# This software is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License only.
+#
+# This software is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this software; if not, write to:
+#  The Free Software Foundation, Inc., 51 Franklin Street,
+#  Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Benchmark and accuracy harness for the rgb_math scalar, lookup table,
+fixed point and (NumPy) batch paths.
+Each case is timed over a mix of random and adversarial inputs (greys,
+primaries and secondaries, sextant boundary angles and the NaN hue) and
+its results compared with a reference implementation.  Run with:
+
+    python -m <package>.rgb_math_bench [--count N] [--lut-size N] ...
+
+The exit status is non zero if any path's maximum deviation from the
+reference exceeds that path's tolerance.
+"""
+
+import argparse
+import array
+import collections
+import math
+import random
+import sys
+import time
+
+from ..bab import mathx
+
+from . import rgb_math
+from . import rgb_math_batch
+
+__all__ = []
+__author__ = "Peter Williams <pwil3058@gmail.com>"
+
+# label: the name of the path
+# function: maps the case's inputs to a list of results
+# tolerance: the maximum acceptable deviation from the reference
+# lut_size: the hue lookup table size in force while timing
+Variant = collections.namedtuple("Variant", ["label", "function", "tolerance", "lut_size"])
+Case = collections.namedtuple("Case", ["name", "inputs", "reference", "variants"])
+Result = collections.namedtuple("Result", ["case", "variant", "count", "colours_per_second", "max_deviation", "ok"])
+
+_BOUNDARY_ANGLES = [sign * angle for angle in (0.0, mathx.PI_60, mathx.PI_120, mathx.PI_180) for sign in (1, -1)]
+
+def adversarial_prgbs():
+    """Return a list of PRGBs likely to expose edge case errors.
+    """
+    prgbs = [rgb_math.PRGB(v, v, v) for v in (0.0, 1.0 / 3, 0.5, 1.0)]
+    for r, g, b in ((1, 0, 0), (0, 1, 0), (0, 0, 1), (1, 1, 0), (0, 1, 1), (1, 0, 1)):
+        prgbs.append(rgb_math.PRGB(float(r), float(g), float(b)))
+        prgbs.append(rgb_math.PRGB(r / 2, g / 2, b / 2))
+    # nearly grey
+    prgbs.extend(rgb_math.PRGB(0.5 + e, 0.5, 0.5 - e) for e in (1e-12, 1e-9, 1e-6))
+    return prgbs
+
+def random_prgbs(rng, count):
+    return [rgb_math.PRGB(rng.random(), rng.random(), rng.random()) for _ in range(count)]
+
+def adversarial_angles():
+    """Return a list of hue angles likely to expose edge case errors.
+    """
+    angles = list(_BOUNDARY_ANGLES)
+    angles.extend(angle + epsilon for angle in _BOUNDARY_ANGLES for epsilon in (1e-12, -1e-12) if abs(angle + epsilon) <= math.pi)
+    angles.append(float("nan"))
+    return angles
+
+def random_angles(rng, count):
+    return [rng.uniform(-math.pi, math.pi) for _ in range(count)]
+
+def _flatten(results):
+    flat = []
+    for item in results:
+        try:
+            flat.extend(float(x) for x in item)
+        except TypeError:
+            flat.append(float(item))
+    return flat
+
+def max_deviation(results, reference):
+    """Return the maximum absolute difference between corresponding
+    numbers in results and reference (NaN matches NaN only).
+    """
+    results, reference = _flatten(results), _flatten(reference)
+    if len(results) != len(reference):
+        return float("inf")
+    deviation = 0.0
+    for a, b in zip(results, reference):
+        if math.isnan(a) or math.isnan(b):
+            if not (math.isnan(a) and math.isnan(b)):
+                return float("inf")
+        else:
+            deviation = max(deviation, abs(a - b))
+    return deviation
+
+# Reference implementations (built directly from the definitions)
+def _ref_rgb_to_xy(rgb):
+    return (rgb[0] - (rgb[1] + rgb[2]) / 2, (rgb[1] - rgb[2]) * math.sqrt(3) / 2)
+
+def _ref_xy_to_rgb(x, y):
+    # solve x = r - (g + b) / 2 and y = (g - b) * sqrt(3) / 2 for each
+    # choice of zero component and take the solution without negatives
+    d = y * 2 / math.sqrt(3)
+    candidates = [
+        (0.0, d / 2 - x, -d / 2 - x),
+        (x - d / 2, 0.0, -d),
+        (x + d / 2, d, 0.0),
+    ]
+    return max(candidates, key=min)
+
+def _ref_max_chroma_prgb(angle):
+    # the max chroma RGB has the hue's direction and a maximum component of one
+    if math.isnan(angle):
+        return (1.0, 1.0, 1.0)
+    rgb = _ref_xy_to_rgb(math.cos(angle), math.sin(angle))
+    top = max(rgb)
+    return tuple(c / top for c in rgb)
+
+def _ref_chroma_correction(angle):
+    # the max chroma RGB's chroma is one by definition
+    if math.isnan(angle):
+        return 1.0
+    return 1.0 / math.hypot(*_ref_rgb_to_xy(_ref_max_chroma_prgb(angle)))
+
+def _ref_hue_angle(prgb):
+    x, y = _ref_rgb_to_xy(prgb)
+    return float("nan") if x == 0.0 and y == 0.0 else math.atan2(y, x)
+
+def _ref_chroma(prgb):
+    x, y = _ref_rgb_to_xy(prgb)
+    return math.hypot(x, y) * _ref_chroma_correction(_ref_hue_angle(prgb))
+
+def _ref_max_chroma_for_value(angle, value):
+    # the largest k for which grey + k * max chroma RGB (whose chroma is
+    # one) has the given value and is in gamut: found by bisection
+    if math.isnan(angle):
+        return 0.0
+    mcp = _ref_max_chroma_prgb(angle)
+    def in_gamut(k):
+        grey = value - k * sum(mcp) / 3
+        return all(0.0 <= grey + k * c <= 1.0 for c in mcp)
+    low, high = 0.0, 1.0
+    for _ in range(64):
+        middle = (low + high) / 2
+        if in_gamut(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+def _ref_max_chroma_prgb_with_value(angle, value):
+    k = _ref_max_chroma_for_value(angle, value)
+    mcp = _ref_max_chroma_prgb(angle)
+    grey = value - k * sum(mcp) / 3
+    return tuple(grey + k * c for c in mcp)
+
+def _ref_prgb_with_chroma(angle, chroma):
+    # the darkest RGB with the hue and chroma has no grey component
+    return tuple(chroma * c for c in _ref_max_chroma_prgb(angle))
+
+def _scalar_path(function):
+    return lambda inputs: [function(*args) for args in inputs]
+
+def _batch_path(function):
+    return lambda inputs: function(*inputs).tolist()
+
+def _make_cases(rng, count, lut_size):
+    prgbs = adversarial_prgbs() + random_prgbs(rng, count)
+    angles = adversarial_angles() + random_angles(rng, count)
+    values = [rng.random() for _ in angles]
+    chromas = [rng.random() for _ in angles]
+    # NB: prgb_with_chroma() requires a non NaN hue
+    hued_angles = [angle for angle in angles if not math.isnan(angle)]
+    lut_tolerance = 0.19 / (lut_size * lut_size) * 4 if lut_size else None
+    def case(name, inputs, reference, scalar, scalar_tolerance, batch=None, batch_inputs=None, lut=True):
+        variants = [Variant("scalar", _scalar_path(scalar), scalar_tolerance, 0)]
+        if lut and lut_tolerance:
+            variants.append(Variant("scalar+lut", _scalar_path(scalar), scalar_tolerance + lut_tolerance, lut_size))
+        if batch is not None and rgb_math_batch.AVAILABLE:
+            variants.append(Variant("batch", lambda _inputs: _batch_path(batch)(batch_inputs()), scalar_tolerance, 0))
+        return Case(name, inputs, _scalar_path(reference), variants)
+    def nd(*columns):
+        return lambda: [rgb_math_batch.numpy.asarray(column, dtype=float) for column in columns]
+    cases = [
+        # NB: hue is ill conditioned for nearly grey colours (the error
+        # is about the rounding error in x and y divided by the chroma)
+        case("hue_angle", [(p,) for p in prgbs], _ref_hue_angle, lambda p: float(rgb_math.HueAngle.from_rgb(p).angle), 1e-4,
+            rgb_math_batch.hue_angles, nd(prgbs), lut=False),
+        case("value", [(p,) for p in prgbs], lambda p: sum(p) / 3, rgb_math.rgb_value_numerator, 1e-12,
+            rgb_math_batch.value_numerators, nd(prgbs), lut=False),
+        case("chroma", [(p,) for p in prgbs], _ref_chroma, rgb_math.rgb_chroma_numerator, 1e-9,
+            rgb_math_batch.chroma_numerators, nd(prgbs)),
+        case("warmth", [(p,) for p in prgbs], lambda p: p[0] - (p[1] + p[2]) / 2, rgb_math.rgb_warmth_numerator, 1e-12,
+            rgb_math_batch.warmth_numerators, nd(prgbs), lut=False),
+        case("max_chroma_prgb", [(a,) for a in angles], _ref_max_chroma_prgb, lambda a: rgb_math.HueAngle(a).max_chroma_prgb, 1e-9,
+            rgb_math_batch.max_chroma_prgbs, nd(angles)),
+        case("chroma_correction", [(a,) for a in angles], _ref_chroma_correction, lambda a: rgb_math.HueAngle(a).chroma_correction, 1e-9,
+            rgb_math_batch.chroma_corrections, nd(angles)),
+        case("max_chroma_for_value", list(zip(angles, values)), _ref_max_chroma_for_value, lambda a, v: rgb_math.HueAngle(a).max_chroma_for_value(v), 1e-9,
+            rgb_math_batch.max_chromas_for_values, nd(angles, values)),
+        case("max_chroma_prgb_with_value", list(zip(angles, values)), _ref_max_chroma_prgb_with_value, lambda a, v: rgb_math.HueAngle(a).max_chroma_prgb_with_value(v), 1e-9,
+            rgb_math_batch.max_chroma_prgbs_with_values, nd(angles, values)),
+        case("prgb_with_chroma", list(zip(hued_angles, chromas)), _ref_prgb_with_chroma, lambda a, c: rgb_math.HueAngle(a).prgb_with_chroma(c), 1e-9,
+            rgb_math_batch.prgbs_with_chroma, nd(hued_angles, chromas[:len(hued_angles)])),
+        case("xy_to_rgb", [tuple(rgb_math.rgb_to_xy(p)) for p in prgbs], _ref_xy_to_rgb, rgb_math.xy_to_rgb, 1e-12,
+            lambda xy: rgb_math_batch.xy_to_rgbs(xy), lambda: [rgb_math_batch.rgbs_to_xy(rgb_math_batch.numpy.asarray(prgbs))], lut=False),
+    ]
+    # integer (8 bit) paths where the reference is the scalar float path
+    irgbs = [tuple(int(c * 255 + 0.5) for c in p) for p in prgbs]
+    flat = array.array("B", [c for rgb in irgbs for c in rgb])
+    delta = rng.uniform(-math.pi, math.pi)
+    rotate_variants = [
+        Variant("scalar", lambda _inputs: [rgb_math.rotate_rgb(rgb, delta) for rgb in irgbs], 1.0, 0),
+        Variant("fixed_point", lambda _inputs: _triples(rgb_math.int_rotate_rgbs(flat, delta)), 1.0, 0),
+    ]
+    value_variants = [
+        Variant("fixed_point", lambda _inputs: list(rgb_math.int_rgbs_values(flat)), 0.5, 0),
+    ]
+    if rgb_math_batch.AVAILABLE:
+        rotate_variants.append(Variant("batch", lambda _inputs: _triples(rgb_math_batch.rotate_rgbs(flat, delta)), 1.0, 0))
+        value_variants.append(Variant("batch", lambda _inputs: rgb_math_batch.value_numerators(flat).tolist(), 1e-9, 0))
+    cases.append(Case("rotate_rgb[B]", [(rgb,) for rgb in irgbs], _scalar_path(lambda rgb: rgb_math.rotate_rgb(tuple(float(c) for c in rgb), delta)), rotate_variants))
+    cases.append(Case("value[B]", [(rgb,) for rgb in irgbs], _scalar_path(lambda rgb: sum(rgb) / 3), value_variants))
+    return cases
+
+def _triples(flat):
+    return [tuple(flat[i:i + 3]) for i in range(0, len(flat), 3)]
+
+def _run_variant(case, variant, repeat):
+    rgb_math.set_hue_lut_size(variant.lut_size)
+    try:
+        best = float("inf")
+        for _ in range(repeat):
+            # NB: time cold caches so repeats don't flatter the scalar paths
+            rgb_math.clear_caches()
+            start = time.perf_counter()
+            results = variant.function(case.inputs)
+            best = min(best, time.perf_counter() - start)
+    finally:
+        rgb_math.set_hue_lut_size(0)
+    return results, best
+
+def run(count=10000, repeat=3, lut_size=4096, seed=0):
+    """Run all cases and return a list of Results.
+    """
+    results = []
+    for case in _make_cases(random.Random(seed), count, lut_size):
+        reference = case.reference(case.inputs)
+        for variant in case.variants:
+            outputs, seconds = _run_variant(case, variant, repeat)
+            deviation = max_deviation(outputs, reference)
+            rate = len(case.inputs) / seconds if seconds > 0 else float("inf")
+            results.append(Result(case.name, variant.label, len(case.inputs), rate, deviation, deviation <= variant.tolerance))
+    return results
+
+def format_results(results):
+    lines = ["{:<28} {:<12} {:>8} {:>14} {:>12}  {}".format("case", "path", "count", "colours/sec", "max dev", "")]
+    for result in results:
+        lines.append("{:<28} {:<12} {:>8} {:>14.0f} {:>12.3g}  {}".format(result.case, result.variant, result.count, result.colours_per_second, result.max_deviation, "ok" if result.ok else "FAIL"))
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the rgb_math scalar, lookup table, fixed point and batch paths.")
+    parser.add_argument("--count", type=int, default=10000, help="number of random inputs per case")
+    parser.add_argument("--repeat", type=int, default=3, help="timing repeats (the best is reported)")
+    parser.add_argument("--lut-size", type=int, default=4096, help="hue lookup table size (0 to skip the lookup table paths)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args(argv)
+    results = run(args.count, args.repeat, args.lut_size, args.seed)
+    print(format_results(results))
+    return 0 if all(result.ok for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
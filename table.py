@@ -44,7 +44,7 @@ class EditableEntriesView(tlview.ListView, actions.CBGUserMixin):
             self.set_size_request(*size_req)
         actions.CBGUserMixin.__init__(self, self.get_selection())
         self._set_modified(False)
-        self.model.connect("row-inserted", self._row_inserted_cb)
+        self._row_inserted_cb_id = self.model.connect("row-inserted", self._row_inserted_cb)
         self.register_modification_callback(self._set_modified, True)
     @property
     def model(self):
@@ -91,7 +91,12 @@ class EditableEntriesView(tlview.ListView, actions.CBGUserMixin):
     def _fetch_contents(self):
         assert False, _("Must be defined in child")
     def set_contents(self):
-        self.model.set_contents(self._fetch_contents())
+        with self.bulk_update() as model:
+            model.handler_block(self._row_inserted_cb_id)
+            try:
+                model.set_contents(self._fetch_contents())
+            finally:
+                model.handler_unblock(self._row_inserted_cb_id)
         self._set_modified(False)
     def get_contents(self):
         return [row for row in self.model.named()]
@@ -225,9 +230,12 @@ class TableView(tlview.ListView, actions.CAGandUIManager, dialogue.BusyIndicator
     def set_contents(self, **kwargs):
         with self.showing_busy():
             self._set_contents(**kwargs)
+    def _refresh_contents(self, **kwargs):
+        # update the existing model in place so that selection survives
+        with self.bulk_update() as model:
+            model.update_contents(self._fetch_contents(**kwargs), keycol=0, reorder=self.last_sort_column is None)
     def refresh_contents(self, **kwargs):
         with self.showing_busy():
-            selected_keys = self.get_selected_keys()
             visible_range = self.get_visible_range()
             if visible_range is not None:
                 start = visible_range[0][0]
@@ -235,18 +243,10 @@ class TableView(tlview.ListView, actions.CAGandUIManager, dialogue.BusyIndicator
                 length = end - start + 1
                 middle_offset = length // 2
                 align = float(middle_offset) / float(length)
-                middle = start + middle_offset
-                middle_key = self.model.get_value(self.model.get_iter(middle), 0)
-            self._set_contents(**kwargs)
-            for key in selected_keys:
-                model_iter = self.model.find_named(lambda x: x[0] == key)
-                if model_iter is not None:
-                    self.seln.select_iter(model_iter)
-            if visible_range is not None:
-                middle_iter = self.model.find_named(lambda x: x[0] == middle_key)
-                if middle_iter is not None:
-                    middle = self.model.get_path(middle_iter)
-                    self.scroll_to_cell(middle, use_align=True, row_align=align)
+                middle_ref = Gtk.TreeRowReference.new(self.model, Gtk.TreePath(start + middle_offset))
+            self._refresh_contents(**kwargs)
+            if visible_range is not None and middle_ref.valid():
+                self.scroll_to_cell(middle_ref.get_path(), use_align=True, row_align=align)
     def get_contents(self):
         return [row for row in self.model.named()]
     def get_selected_data(self, columns=None):
@@ -260,12 +260,9 @@ class TableView(tlview.ListView, actions.CAGandUIManager, dialogue.BusyIndicator
             result.append(store.get(model_iter, *columns))
         return result
     def get_selected_keys(self, keycol=0):
-        store, selected_rows = self.seln.get_selected_rows()
+        # NB: selected_foreach() hands us iters so no path to iter lookups
         keys = []
-        for row in selected_rows:
-            model_iter = store.get_iter(row)
-            assert model_iter is not None
-            keys.append(store.get_value(model_iter, keycol))
+        self.seln.selected_foreach(lambda store, _path, model_iter: keys.append(store.get_value(model_iter, keycol)))
         return keys
     def get_selected_data_by_label(self, labels):
         return self.get_selected_data(self.model.col_indices(labels))
@@ -282,7 +279,7 @@ class TableView(tlview.ListView, actions.CAGandUIManager, dialogue.BusyIndicator
         return self.get_selected_key(self.model.col_index(label))
     def select_and_scroll_to_row_with_key_value(self, key_value, key=None):
         index = 0 if key is None else (key if isinstance(key, int) else self.model.col_index(key))
-        model_iter = self.model.find_named(lambda x: x[index] == key_value)
+        model_iter = self.model.find_named(tlview.KeyEqualityTest(index, key_value))
         if not model_iter:
             return False
         self.seln.select_iter(model_iter)
@@ -36,7 +36,10 @@ if AVAILABLE:
 
     class Terminal(Gtk.ScrolledWindow, enotify.Listener):
         ARGV = [os.getenv("SHELL", "/bin/bash")]
-        def __init__(self, follow_chdir=True):
+        # milliseconds without a working directory change before the
+        # shell is told to change to the latest one
+        CHDIR_DELAY = 250
+        def __init__(self, follow_chdir=True, spawn_async=False):
             Gtk.ScrolledWindow.__init__(self, None, None)
             enotify.Listener.__init__(self)
             self._vte = Vte.Terminal()
@@ -45,15 +48,81 @@ if AVAILABLE:
             self._vte.set_scrollback_lines(-1)
             self._vte.show()
             self._vte.connect("button_press_event", self._button_press_cb)
+            # NB: only reported by shells that announce their directory (OSC 7)
+            self._shell_cwd = None
+            self._vte.connect("current-directory-uri-changed", self._shell_cwd_changed_cb)
+            self._pending_cwd = None
+            self._chdir_timeout_id = None
+            self.connect("destroy", self._destroy_cb)
             self.add(self._vte)
             self.show_all()
-            self._pid = self._vte.spawn_sync(Vte.PtyFlags.DEFAULT, os.getcwd(), self.ARGV, [], GLib.SpawnFlags.DO_NOT_REAP_CHILD, None, None,)
+            self._following_chdir = False
+            # the directory the shell was last told to be in
+            self._sent_cwd = os.getcwd()
+            self._spawn_failed = False
+            if spawn_async:
+                # NB: pid stays None until the shell has started
+                self._pid = None
+                self._vte.spawn_async(Vte.PtyFlags.DEFAULT, self._sent_cwd, self.ARGV, None, GLib.SpawnFlags.DO_NOT_REAP_CHILD, None, None, -1, None, self._spawn_async_cb, None)
+            else:
+                self._pid = self._vte.spawn_sync(Vte.PtyFlags.DEFAULT, self._sent_cwd, self.ARGV, [], GLib.SpawnFlags.DO_NOT_REAP_CHILD, None, None,)
             if follow_chdir:
+                self.follow_chdir()
+        def _spawn_async_cb(self, vte, pid, error, _user_data=None):
+            if error is not None or pid == -1:
+                self._spawn_failed = True
+            else:
+                self._pid = pid
+        @property
+        def is_ready(self):
+            return self._pid is not None
+        @property
+        def spawn_failed(self):
+            return self._spawn_failed
+        def follow_chdir(self):
+            """Make the shell follow the application's working directory
+            changes (starting with the current one).
+            """
+            if not self._following_chdir:
                 self.add_notification_cb(enotify.E_CHANGE_WD, self._cwd_cb)
+                self._following_chdir = True
+            self.catch_up_cwd()
+        def catch_up_cwd(self):
+            """Tell the shell to change to the application's working
+            directory unless that's where it was last told to be.
+            """
+            cwd = os.getcwd()
+            if os.path.realpath(cwd) != os.path.realpath(self._sent_cwd):
+                self.set_cwd(cwd)
         def _cwd_cb(self, **kwargs):
-            self.set_cwd(os.getcwd())
+            # Wait for things to settle so that only the latest is sent
+            self._pending_cwd = os.getcwd()
+            if self._chdir_timeout_id is not None:
+                GLib.source_remove(self._chdir_timeout_id)
+            self._chdir_timeout_id = GLib.timeout_add(self.CHDIR_DELAY, self._chdir_timeout_cb)
+        def _chdir_timeout_cb(self):
+            self._chdir_timeout_id = None
+            path, self._pending_cwd = self._pending_cwd, None
+            if path is not None and os.path.realpath(path) != self._shell_cwd:
+                self.set_cwd(path)
+            return False
+        def _shell_cwd_changed_cb(self, vte):
+            uri = vte.get_current_directory_uri()
+            try:
+                self._shell_cwd = os.path.realpath(GLib.filename_from_uri(uri)[0]) if uri else None
+            except GLib.Error:
+                self._shell_cwd = None
+        def connect_child_exited(self, callback):
+            return self._vte.connect("child-exited", lambda _vte, _status: callback(self))
+        def _destroy_cb(self, _widget):
+            if self._chdir_timeout_id is not None:
+                GLib.source_remove(self._chdir_timeout_id)
+                self._chdir_timeout_id = None
         def set_cwd(self, path):
-            command = "cd {}\n".format(utils.quote_if_needed(os.path.abspath(os.path.expanduser(path))))
+            # NB: the shell may be busy so its directory is unknown until it reports
+            self._shell_cwd = None
+            self._sent_cwd = os.path.abspath(os.path.expanduser(path))
+            command = "cd {}\n".format(utils.quote_if_needed(self._sent_cwd))
             try:
                 self._vte.feed_child(command, len(command))
             except TypeError:
@@ -75,6 +144,84 @@ if AVAILABLE:
                     menu.popup(None, None, None, None, event.button, event.time)
                     return True
             return False
+    class TerminalPool:
+        """A pool of terminals whose shells are spawned asynchronously
+        in the background so that (for shells with slow start up files)
+        taking a terminal from the pool is near instant.
+        """
+        def __init__(self, terminal_class=Terminal, size=1):
+            self._terminal_class = terminal_class
+            self._size = size
+            self._idle = []
+            self._refill_id = None
+            self._schedule_refill()
+        def _schedule_refill(self):
+            if self._refill_id is None:
+                self._refill_id = GLib.idle_add(self._refill_cb, priority=GLib.PRIORITY_LOW)
+        def _refill_cb(self):
+            self._refill_id = None
+            for terminal in [terminal for terminal in self._idle if terminal.spawn_failed]:
+                self._idle.remove(terminal)
+                terminal.destroy()
+            if len(self._idle) < self._size:
+                terminal = self._terminal_class(follow_chdir=False, spawn_async=True)
+                terminal.connect_child_exited(self._idle_child_exited_cb)
+                self._idle.append(terminal)
+                # one at a time so as not to hog the main loop
+                self._schedule_refill()
+            return False
+        def _idle_child_exited_cb(self, terminal):
+            if terminal in self._idle:
+                self._idle.remove(terminal)
+                terminal.destroy()
+                self._schedule_refill()
+        def take(self, follow_chdir=True):
+            """Return a terminal (from the pool if one is ready) and
+            refill the pool in the background.
+            """
+            for index, terminal in enumerate(self._idle):
+                if terminal.is_ready:
+                    del self._idle[index]
+                    break
+            else:
+                terminal = self._terminal_class(follow_chdir=False)
+            # NB: its shell started in the working directory at refill time
+            if follow_chdir:
+                terminal.follow_chdir()
+            else:
+                terminal.catch_up_cwd()
+            self._schedule_refill()
+            return terminal
+        def destroy(self):
+            if self._refill_id is not None:
+                GLib.source_remove(self._refill_id)
+                self._refill_id = None
+            for terminal in self._idle:
+                terminal.destroy()
+            self._idle = []
+
+    # NB: pre-spawning needs Vte.Terminal.spawn_async() (VTE 0.48 or later)
+    POOL_AVAILABLE = hasattr(Vte.Terminal, "spawn_async")
+    _POOLS = {}
+
+    def enable_pool(terminal_class=Terminal, size=1):
+        """Keep size pre-spawned terminals of terminal_class ready for
+        new_terminal() (a size of 0 disables the pool).
+        """
+        pool = _POOLS.pop(terminal_class, None)
+        if pool is not None:
+            pool.destroy()
+        if size > 0 and POOL_AVAILABLE:
+            _POOLS[terminal_class] = TerminalPool(terminal_class, size)
+
+    def new_terminal(terminal_class=Terminal, follow_chdir=True):
+        """Return a new terminal taking it from the pool if there is one.
+        """
+        pool = _POOLS.get(terminal_class, None)
+        if pool is None:
+            return terminal_class(follow_chdir=follow_chdir)
+        return pool.take(follow_chdir=follow_chdir)
+
     GITSOME = which("gitsome")
     if GITSOME:
         GITSOME_AVAILABLE = True
@@ -19,6 +19,7 @@ them from templates and allow easier access to named contents.
 """
 
 import collections
+from contextlib import contextmanager
 
 import gi
 gi.require_version("Gtk", "3.0")
@@ -26,16 +27,48 @@ from gi.repository import Gtk
 from gi.repository import GObject
 from gi.repository import Gdk
 
+class KeyEqualityTest:
+    """
+    A find_named() predicate that selects the row whose "index" column
+    equals "value".  Models with a key index on that column use the
+    index instead of searching.
+    """
+    __slots__ = ("index", "value")
+    def __init__(self, index, value):
+        self.index = index
+        self.value = value
+    def __call__(self, row):
+        return row[self.index] == self.value
+
 class _NamedTreeModelMixin:
     # TODO: trim and improve _NamedTreeModelMixin
     ROW = None # this is a namedtuple type
     TYPES = None # this is an instance of ROW defining column types
+    KEY_INDEX_COL = None # label or index of a column to index by default
+    _key_index = None
+    _key_index_col = None
+    @classmethod
+    def _col_index_map(cls):
+        # NB: built on first use and kept in the class's own __dict__
+        # as subclasses may define a different ROW
+        try:
+            return cls.__dict__["_COL_INDEX_MAP"]
+        except KeyError:
+            cls._COL_INDEX_MAP = {label: index for index, label in enumerate(cls.ROW._fields)}
+            return cls._COL_INDEX_MAP
     @classmethod
     def col_index(cls, label):
-        return cls.ROW._fields.index(label)
+        try:
+            return cls._col_index_map()[label]
+        except KeyError:
+            raise ValueError("{0}: unknown column label".format(label))
     @classmethod
     def col_indices(cls, labels):
-        return [cls.ROW._fields.index(label) for label in labels]
+        col_index_map = cls._col_index_map()
+        try:
+            return [col_index_map[label] for label in labels]
+        except KeyError as edata:
+            raise ValueError("{0}: unknown column label".format(edata.args[0]))
     @staticmethod
     def get_selected_rows(selection):
         model, paths = selection.get_selected_rows()
@@ -45,7 +78,7 @@ class _NamedTreeModelMixin:
         model, model_iter = selection.get_selected()
         return model.ROW(*model[tree_iter])
     def get_row(self, model_iter):
-        return self.ROW(*self[model_iter])
+        return self.ROW._make(self.get(model_iter, *self._col_index_map().values()))
     def get_named(self, model_iter, *labels):
         return self.get(model_iter, *self.col_indices(labels))
     def get_value_named(self, model_iter, label):
@@ -67,7 +100,23 @@ class _NamedTreeModelMixin:
             yield self.get_row(model_iter)
             model_iter = self.iter_next(model_iter)
         return
+    def iter_column(self, label):
+        # Iterate over the values in the named column without building whole rows
+        index = self.col_index(label)
+        model_iter = self.get_iter_first()
+        while model_iter is not None:
+            yield self.get_value(model_iter, index)
+            model_iter = self.iter_next(model_iter)
+    def iter_columns(self, *labels):
+        # Iterate over rows as tuples containing only the named columns
+        indices = self.col_indices(labels)
+        model_iter = self.get_iter_first()
+        while model_iter is not None:
+            yield self.get(model_iter, *indices)
+            model_iter = self.iter_next(model_iter)
     def find_named(self, select_func):
+        if isinstance(select_func, KeyEqualityTest) and select_func.index == self._key_index_col:
+            return self.get_iter_for_key(select_func.value)
         model_iter = self.get_iter_first()
         while model_iter:
             if select_func(self.get_row(model_iter)):
@@ -75,23 +124,162 @@ class _NamedTreeModelMixin:
             else:
                 model_iter = self.iter_next(model_iter)
         return None
+    # Key index: maps key column values to TreeRowReferences (keys are
+    # assumed to be unique) and is kept up to date via the model's signals.
+    # NB: GTK updates every live TreeRowReference whenever a row is
+    # inserted, deleted or reordered so, with an index enabled, each such
+    # change costs O(rows): use key_index_suspended() for bulk changes.
+    def enable_key_index(self, key=0):
+        self.disable_key_index()
+        self._key_index_col = key if isinstance(key, int) else self.col_index(key)
+        self.rebuild_key_index()
+        self._key_index_cb_ids = [
+            self.connect("row-inserted", _NamedTreeModelMixin._key_index_row_set_cb),
+            self.connect("row-changed", _NamedTreeModelMixin._key_index_row_set_cb),
+            self.connect("row-deleted", _NamedTreeModelMixin._key_index_row_deleted_cb),
+        ]
+    def disable_key_index(self):
+        if self._key_index is None:
+            return
+        for cb_id in self._key_index_cb_ids:
+            self.disconnect(cb_id)
+        self._key_index = None
+        self._key_index_col = None
+    @property
+    def has_key_index(self):
+        return self._key_index is not None
+    def rebuild_key_index(self):
+        self._key_index = {}
+        self._key_index_n_deleted = 0
+        self.foreach(_NamedTreeModelMixin._key_index_add_row, None)
+    @staticmethod
+    def _key_index_add_row(model, path, model_iter, _data=None):
+        model._key_index[model.get_value(model_iter, model._key_index_col)] = Gtk.TreeRowReference.new(model, path)
+        return False
+    @staticmethod
+    def _key_index_row_set_cb(model, path, model_iter):
+        ref = model._key_index.get(model.get_value(model_iter, model._key_index_col), None)
+        if ref is None or not ref.valid() or ref.get_path() != path:
+            model._key_index_add_row(model, path, model_iter)
+    @staticmethod
+    def _key_index_row_deleted_cb(model, path):
+        # references to deleted rows become invalid so just purge them
+        # every so often rather than searching for them on every delete
+        model._key_index_n_deleted += 1
+        if model._key_index_n_deleted > 64 + len(model._key_index) // 2:
+            model._key_index = {key: ref for key, ref in model._key_index.items() if ref.valid()}
+            model._key_index_n_deleted = 0
+    @contextmanager
+    def key_index_suspended(self):
+        # for bulk changes: rebuilding once is cheaper than row by row upkeep
+        if self._key_index is None:
+            yield
+            return
+        for cb_id in self._key_index_cb_ids:
+            self.handler_block(cb_id)
+        # release the references so GTK doesn't update them on every change
+        self._key_index = {}
+        try:
+            yield
+        finally:
+            for cb_id in self._key_index_cb_ids:
+                self.handler_unblock(cb_id)
+            self.rebuild_key_index()
+    def get_iter_for_key(self, key_value):
+        assert self._key_index is not None
+        ref = self._key_index.get(key_value, None)
+        if ref is None:
+            return None
+        if ref.valid():
+            model_iter = self.get_iter(ref.get_path())
+            if self.get_value(model_iter, self._key_index_col) == key_value:
+                return model_iter
+        # the row has been deleted or its key changed
+        del self._key_index[key_value]
+        return None
 
 class NamedListStore(Gtk.ListStore, _NamedTreeModelMixin):
     __g_type_name__ = "NamedListStore"
     def __init__(self):
         Gtk.ListStore.__init__(*[self] + list(self.TYPES))
-    def append_contents(self, rows):
+        if self.KEY_INDEX_COL is not None:
+            self.enable_key_index(self.KEY_INDEX_COL)
+    def _bulk_append(self, rows):
+        # NB: use the column index form of insert_with_valuesv() with
+        # pre-typed values to avoid per row conversion overheads
+        columns = list(range(self.get_n_columns()))
+        col_types = [self.get_column_type(column) for column in columns]
         for row in rows:
-            self.append(row)
+            self.insert_with_valuesv(-1, columns, [GObject.Value(col_type, value) for col_type, value in zip(col_types, row)])
+    def append_contents(self, rows):
+        with self.key_index_suspended():
+            self._bulk_append(rows)
     def set_contents(self, rows):
-        self.clear()
-        for row in rows:
-            self.append(row)
+        with self.key_index_suspended():
+            self.clear()
+            self._bulk_append(rows)
+    def update_contents(self, rows, keycol=0, reorder=True):
+        """
+        Make the contents match "rows" by deleting, inserting and
+        updating only those rows that differ (matched on the value in
+        column "keycol") so that existing iters, selection and scroll
+        position are preserved.  If "reorder" is False the order of
+        rows already in the model is left alone and new rows are
+        appended (e.g. when the view is sorting the model anyway).
+        """
+        rows = [tuple(row) for row in rows]
+        new_keys = set(row[keycol] for row in rows)
+        columns = list(range(self.get_n_columns()))
+        if self._key_index is not None and keycol == self._key_index_col:
+            # NB: list store iters persist so those found via the index
+            # (before it's suspended) stay valid across the changes below
+            key_iters = {}
+            stale_iters = []
+            for key in list(self._key_index):
+                model_iter = self.get_iter_for_key(key)
+                if model_iter is None:
+                    continue
+                if key in new_keys:
+                    key_iters[key] = model_iter
+                else:
+                    stale_iters.append(model_iter)
+        else:
+            key_iters = None
+        with self.key_index_suspended():
+            if key_iters is None:
+                key_iters = {}
+                model_iter = self.get_iter_first()
+                while model_iter is not None:
+                    key = self.get_value(model_iter, keycol)
+                    if key in new_keys and key not in key_iters:
+                        key_iters[key] = model_iter
+                        model_iter = self.iter_next(model_iter)
+                    elif not self.remove(model_iter):
+                        model_iter = None
+            else:
+                for model_iter in stale_iters:
+                    self.remove(model_iter)
+            # Rows before "cursor" have been dealt with and those at or after it haven't
+            cursor = self.get_iter_first() if reorder else None
+            for row in rows:
+                old_iter = key_iters.pop(row[keycol], None)
+                if old_iter is None:
+                    self.insert_before(cursor, row)
+                    continue
+                if cursor is not None:
+                    if self.get_path(old_iter) == self.get_path(cursor):
+                        cursor = self.iter_next(cursor)
+                    else:
+                        self.move_before(old_iter, cursor)
+                if tuple(self.get(old_iter, *columns)) != row:
+                    self.set_row(old_iter, row)
 
 class NamedTreeStore(Gtk.TreeStore, _NamedTreeModelMixin):
     __g_type_name__ = "NamedTreeStore"
     def __init__(self):
         Gtk.TreeStore.__init__(*[self] + list(self.TYPES))
+        if self.KEY_INDEX_COL is not None:
+            self.enable_key_index(self.KEY_INDEX_COL)
 
 # Utility functions
 def delete_selection(seln):
@@ -308,6 +496,8 @@ class View(Gtk.TreeView):
             self.set_property(prop_name, prop_val)
         if spec.selection_mode is not None:
             self.get_selection().set_mode(spec.selection_mode)
+        self._sort_specs = []
+        self._sort_key_cache = None
         for col_d in spec.columns:
             self._view_add_column(col_d)
         self.connect("button_press_event", self._handle_clear_selection_cb)
@@ -317,17 +507,18 @@ class View(Gtk.TreeView):
         self._modified_cbs = []
     def _connect_model_changed_cbs(self):
         """
-        Set up the call back for changes to the store so that the
-        "sorted" indicator can be turned off if the model changes in
-        any way.
+        Install the sort functions for the sortable columns in the
+        store (which keeps itself sorted from then on) and set up the
+        call backs used to track the sort state.
         """
         model = self.get_model()
-        sig_names = ["row-changed", "row-deleted", "row-has-child-toggled",
-            "row-inserted", "rows-reordered"]
-        self._change_cb_ids = [model.connect(sig_name, self._model_changed_cb) for sig_name in sig_names]
-        self.last_sort_column = None
-        self.last_sort_function = None
-        self.sort_order = Gtk.SortType.ASCENDING
+        self._change_cb_ids = []
+        if isinstance(model, Gtk.TreeSortable):
+            for sort_column_id, (_column, sort_key_function) in enumerate(self._sort_specs):
+                model.set_sort_func(sort_column_id, self._sort_func, sort_key_function)
+            self._change_cb_ids.append(model.connect("sort-column-changed", self._sort_column_changed_cb))
+            self._change_cb_ids.append(model.connect("rows-reordered", self._rows_reordered_cb))
+        self._sort_column_changed_cb(model)
     @staticmethod
     def _create_cell(column, cell_renderer_spec):
         cell = cell_renderer_spec.cell_renderer()
@@ -356,8 +547,9 @@ class View(Gtk.TreeView):
         for cell_d in col_d.cells:
             self._view_add_cell(col, cell_d)
         if col_d.sort_key_function is not None:
-            col.connect("clicked", self._column_clicked_cb, lambda x: col_d.sort_key_function(x[1]))
-            col.set_clickable(True)
+            # NB: the column takes care of the indicator and toggling the order
+            col.set_sort_column_id(len(self._sort_specs))
+            self._sort_specs.append((col, col_d.sort_key_function))
     def _view_add_cell(self, col, cell_d):
         cell = self._create_cell(col, cell_d.cell_renderer_spec)
         if cell_d.cell_data_function_spec is not None:
@@ -382,6 +574,30 @@ class View(Gtk.TreeView):
         Gtk.TreeView.set_model(self, model)
         if model is not None:
             self._connect_model_changed_cbs()
+    @contextmanager
+    def bulk_update(self):
+        """
+        Make bulk changes to the model without it being kept sorted
+        as each row is changed.  The model is re-sorted once when the
+        changes are complete.
+        """
+        model = self.get_model()
+        if isinstance(model, Gtk.TreeSortable):
+            sort_column_id, sort_order = model.get_sort_column_id()
+        else:
+            sort_column_id = None
+        is_sorted = sort_column_id is not None
+        if is_sorted:
+            for cb_id in self._change_cb_ids:
+                model.handler_block(cb_id)
+            model.set_sort_column_id(Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID, sort_order)
+            for cb_id in self._change_cb_ids:
+                model.handler_unblock(cb_id)
+        try:
+            yield model
+        finally:
+            if is_sorted:
+                model.set_sort_column_id(sort_column_id, sort_order)
     def _notify_modification(self):
         for cbk, data in self._modified_cbs:
             if data is None:
@@ -412,59 +628,44 @@ class View(Gtk.TreeView):
         # should it be model[path][index] = not model[path][index]
         self.model[path][index] = cell.get_active()
         self._notify_modification()
-    def _model_changed_cb(self, model, *_args, **_kwargs):
-        """
-        The model has changed and if the column involved is the
-        current sort column the may no longer be sorted so we
-        need to re-sort the list.
-        """
-        if self.last_sort_column is not None:
-            assert self.last_sort_function is not None
-            if len(model) == 0:
-                return
-            if hasattr(model, "named"):
-                erows = list(enumerate(model.named()))
-            else:
-                erows = list(enumerate(model))
-            erows.sort(key=self.last_sort_function)
-            if self.sort_order == Gtk.SortType.DESCENDING:
-                erows.reverse()
-            # Turn off reorder callback while we do the reordering
-            model.handler_block(self._change_cb_ids[-1])
-            model.reorder([r[0] for r in erows])
-            model.handler_unblock(self._change_cb_ids[-1])
-    def _column_clicked_cb(self, column, sort_key_function):
-        """Sort the rows based on the given column"""
-        # Heavily based on the FAQ example
-        assert column.get_tree_view() == self
-        if self.last_sort_column is not None:
-            self.last_sort_column.set_sort_indicator(False)
-        #
-        if self.last_sort_column == column:
-           if self.sort_order == Gtk.SortType.ASCENDING:
-              self.sort_order = Gtk.SortType.DESCENDING
-           else:
-              self.sort_order = Gtk.SortType.ASCENDING
+    def _sort_column_changed_cb(self, model):
+        if isinstance(model, Gtk.TreeSortable):
+            # NB: (None, None) if the model isn't sorted
+            sort_column_id, sort_order = model.get_sort_column_id()
         else:
-           self.sort_order   = Gtk.SortType.ASCENDING
-           self.last_sort_column = column
-           self.last_sort_function = sort_key_function
-        model = self.get_model()
-        if len(model) == 0:
-            return
-        if hasattr(model, "named"):
-            erows = list(enumerate(model.named()))
+            sort_column_id = None
+        if sort_column_id is not None and 0 <= sort_column_id < len(self._sort_specs):
+            self.last_sort_column, self.last_sort_function = self._sort_specs[sort_column_id]
+            self.sort_order = sort_order
+            # the store is about to do a full sort so it's worth
+            # caching the sort keys until it's finished
+            self._sort_key_cache = {} if len(model) > 1 else None
         else:
-            erows = list(enumerate(model))
-        erows.sort(key=sort_key_function)
-        if self.sort_order == Gtk.SortType.DESCENDING:
-            erows.reverse()
-        # Turn off reorder callback while we do the reordering
-        model.handler_block(self._change_cb_ids[-1])
-        model.reorder([r[0] for r in erows])
-        model.handler_unblock(self._change_cb_ids[-1])
-        column.set_sort_indicator(True)
-        column.set_sort_order(self.sort_order)
+            self.last_sort_column = None
+            self.last_sort_function = None
+            self.sort_order = Gtk.SortType.ASCENDING
+            self._sort_key_cache = None
+    def _rows_reordered_cb(self, model, *_args):
+        # NB: rows may change (and iters be reused) after the sort so
+        # the cache can't be trusted beyond this point
+        self._sort_key_cache = None
+    def _get_sort_key(self, model, model_iter, sort_key_function):
+        if self._sort_key_cache is not None:
+            try:
+                return self._sort_key_cache[model_iter.user_data]
+            except KeyError:
+                pass
+        row = model.get_row(model_iter) if hasattr(model, "get_row") else tuple(model[model_iter])
+        sort_key = sort_key_function(row)
+        if self._sort_key_cache is not None:
+            self._sort_key_cache[model_iter.user_data] = sort_key
+        return sort_key
+    def _sort_func(self, model, iter_a, iter_b, sort_key_function):
+        key_a = self._get_sort_key(model, iter_a, sort_key_function)
+        key_b = self._get_sort_key(model, iter_b, sort_key_function)
+        if key_a < key_b:
+            return -1
+        return 1 if key_b < key_a else 0
 
 class ListView(View):
     __g_type_name__ = "ListView"